@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""
+Throughput and latency of the influxdb read and write paths, measured
+against the local stand-in server in tests/ifdb_server.py.
+
+usage:
+    python -m benchmarks.bench_influxdb --hours 24 --latency 0.05
+"""
+
+import sys
+import timeit
+import logging
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from tests.ifdb_server import standinServer
+from tools.influxdb_funcs import (
+    read_ifdb,
+    read_aux_ifdb,
+    check_oldest_db_ts,
+    ifdb_push,
+)
+
+
+def run(func, repeat):
+    """Run func repeat times, return the result and the timings in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        value = func()
+        times.append(timeit.default_timer() - start)
+    return value, np.array(times)
+
+
+def report(name, times, rows=None):
+    line = f"{name:<20} median {np.median(times) * 1000:9.1f} ms"
+    line += f"  min {times.min() * 1000:9.1f} ms"
+    if rows:
+        line += f"  {rows / np.median(times):12.0f} rows/s"
+    print(line)
+
+
+def main(args):
+    logging.getLogger("defaultLogger").setLevel(logging.WARNING)
+    start = datetime.datetime(2021, 10, 2)
+    stop = start + datetime.timedelta(hours=args.hours)
+    with standinServer(latency=args.latency) as srv:
+        ifdb_dict = {
+            "url": srv.url,
+            "token": "token",
+            "organization": "org",
+            "bucket": "bucket",
+            "measurement_name": "fluxes",
+            "timeout": "600000",
+        }
+        meas_dict = {"measurement": "licor", "fields": "CO2,CH4"}
+        aux_dict = {**ifdb_dict, "measurement_name": "met", "field": "air_temp"}
+
+        df, times = run(lambda: read_ifdb(ifdb_dict, meas_dict, start, stop), args.repeat)
+        report("read_ifdb", times, len(df))
+
+        aux, times = run(
+            lambda: read_aux_ifdb(aux_dict, str(start), str(stop)), args.repeat
+        )
+        report("read_aux_ifdb", times, len(aux))
+
+        _, times = run(
+            lambda: check_oldest_db_ts(ifdb_dict, meas_dict, ["CO2", "CH4"]),
+            args.repeat,
+        )
+        report("check_oldest_db_ts", times)
+
+        index = pd.date_range(start, periods=args.push_rows, freq="15min")
+        push = pd.DataFrame(
+            {
+                "chamber": np.arange(args.push_rows) % 12,
+                "CO2_flux": np.random.default_rng(0).normal(size=args.push_rows),
+            },
+            index=index,
+        )
+        _, times = run(lambda: ifdb_push(push, ifdb_dict, ["chamber"]), args.repeat)
+        report("ifdb_push", times, len(push))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hours", type=float, default=6, help="hours of 1 Hz data")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--push-rows", type=int, default=10000)
+    sys.exit(main(parser.parse_args()))
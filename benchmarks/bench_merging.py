@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""
+Scaling of merge_by_dtx_and_id with the number of chambers and rows, and of
+merging several aux sources one by one compared to merge_aux_cfgs.
+
+usage:
+    python -m benchmarks.bench_merging --rows 1000000 --sources 6
+"""
+
+import sys
+import timeit
+import tracemalloc
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tools.merging import merge_by_dtx, merge_by_dtx_and_id, merge_aux_cfgs
+
+
+def mk_frames(n_rows, n_chambers):
+    """1 Hz gas data cycling through the chambers and 1 min aux data per chamber"""
+    rng = np.random.default_rng(0)
+    idx = pd.date_range("2021-10-01", periods=n_rows, freq="s", name="datetime")
+    main = pd.DataFrame(
+        {"chamber": (np.arange(n_rows) // 900) % n_chambers, "CO2": rng.normal(size=n_rows)},
+        index=idx,
+    )
+    aux_idx = pd.date_range("2021-10-01", periods=n_rows // 60, freq="min", name="datetime")
+    aux = pd.DataFrame(
+        {
+            "chamber": np.arange(len(aux_idx)) % n_chambers,
+            "snowdepth": rng.normal(size=len(aux_idx)),
+        },
+        index=aux_idx,
+    )
+    return main, aux
+
+
+def mk_sources(n_rows, n_sources):
+    """10 min aux data for n_sources time merged aux cfgs"""
+    rng = np.random.default_rng(1)
+    aux_idx = pd.date_range(
+        "2021-10-01", periods=n_rows // 600, freq="10min", name="datetime"
+    )
+    return [
+        {
+            "name": f"aux{i}",
+            "merge_method": "time",
+            "tolerance": "15min",
+            "df": pd.DataFrame({f"aux{i}": rng.normal(size=len(aux_idx))}, index=aux_idx),
+        }
+        for i in range(n_sources)
+    ]
+
+
+def one_by_one(main_df, cfgs):
+    merged = main_df.copy()
+    for cfg in cfgs:
+        merged = merge_by_dtx(merged, {**cfg, "df": cfg["df"].copy()})
+    return merged
+
+
+def one_pass(main_df, cfgs):
+    return merge_aux_cfgs(main_df.copy(), cfgs)
+
+
+def measure(func, *args, repeat=3):
+    """best time in seconds and peak traced memory in MB"""
+    best = min(timeit.repeat(lambda: func(*args), number=1, repeat=repeat))
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 1024**2
+    tracemalloc.stop()
+    return best, peak
+
+
+def bench_sources(n_rows, n_sources):
+    main_df, _ = mk_frames(n_rows, 4)
+    cfgs = mk_sources(n_rows, n_sources)
+    return measure(one_by_one, main_df, cfgs) + measure(one_pass, main_df, cfgs)
+
+
+def main(args):
+    logging.getLogger("defaultLogger").setLevel(logging.WARNING)
+    print(f"{'rows':>10} {'chambers':>9} {'seconds':>9}")
+    for n_rows in args.rows:
+        for n_chambers in args.chambers:
+            main_df, aux_df = mk_frames(n_rows, n_chambers)
+            cfg = {"df": aux_df, "name": "snowdepth", "tolerance": "1d"}
+            start = timeit.default_timer()
+            merge_by_dtx_and_id(main_df, cfg)
+            elapsed = timeit.default_timer() - start
+            print(f"{n_rows:>10} {n_chambers:>9} {elapsed:>9.3f}")
+
+    print(
+        f"\n{'rows':>10} {'sources':>9} {'one by one s':>13} {'peak MB':>8}"
+        f" {'one pass s':>11} {'peak MB':>8}"
+    )
+    for n_rows in args.rows:
+        for n_sources in args.sources:
+            t_seq, m_seq, t_one, m_one = bench_sources(n_rows, n_sources)
+            print(
+                f"{n_rows:>10} {n_sources:>9} {t_seq:>13.3f} {m_seq:>8.0f}"
+                f" {t_one:>11.3f} {m_one:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[250000, 1000000])
+    parser.add_argument("--chambers", type=int, nargs="+", default=[4, 16, 64, 256])
+    parser.add_argument("--sources", type=int, nargs="+", default=[1, 3, 6])
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+Vectorized time parsing against the per string implementations it
+replaced.
+
+usage:
+    python -m benchmarks.bench_time_parsing --rows 1000000
+"""
+
+import sys
+import timeit
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tools.time_funcs import time_to_numeric, parse_date_and_time
+
+
+def run(func, repeat):
+    """Run func repeat times, return the result and the timings in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        value = func()
+        times.append(timeit.default_timer() - start)
+    return value, np.array(times)
+
+
+def report(name, times, rows=None):
+    line = f"{name:<24} median {np.median(times) * 1000:9.1f} ms"
+    line += f"  min {times.min() * 1000:9.1f} ms"
+    if rows:
+        line += f"  {rows / np.median(times):12.0f} rows/s"
+    print(line)
+
+
+def loop_time_to_numeric(time):
+    """time_to_numeric before it was vectorized"""
+    split_times = [time.split(":") for time in time]
+    return np.array(
+        [(int(h) * 3600 + int(m) * 60 + int(s)) for h, m, s in split_times]
+    ).round(10)
+
+
+def mk_strings(rows):
+    """DATE and TIME columns like in the LI-7810 files, as object arrays"""
+    rng = np.random.default_rng(0)
+    seconds = rng.integers(0, 3 * 365 * 86400, rows)
+    times = pd.Timestamp("2021-01-01") + pd.to_timedelta(seconds, unit="s")
+    dates = times.strftime("%Y-%m-%d").to_numpy(dtype=object)
+    hms = times.strftime("%H:%M:%S").to_numpy(dtype=object)
+    return dates, hms
+
+
+def main(args):
+    dates, hms = mk_strings(args.rows)
+    print(f"{args.rows} rows")
+
+    old, times = run(lambda: loop_time_to_numeric(hms), args.repeat)
+    report("time_to_numeric loop", times, args.rows)
+    new, times = run(lambda: time_to_numeric(hms), args.repeat)
+    report("time_to_numeric", times, args.rows)
+    assert (old == new).all()
+
+    def to_datetime():
+        return pd.to_datetime(
+            pd.Series(dates) + pd.Series(hms), format="%Y-%m-%d%H:%M:%S"
+        )
+
+    old, times = run(to_datetime, args.repeat)
+    report("pd.to_datetime", times, args.rows)
+    new, times = run(
+        lambda: parse_date_and_time(dates, hms, "%Y-%m-%d", "%H:%M:%S"),
+        args.repeat,
+    )
+    report("parse_date_and_time", times, args.rows)
+    assert (old.to_numpy() == new).all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    sys.exit(main(parser.parse_args()))
@@ -12,6 +12,9 @@ from pathlib import Path
 from tools.fluxer import fluxCalculator
 from tools.time_funcs import convert_seconds
 from tools.logger import init_logger
+from tools.fingerprint import write_changed_csv
+from tools.influxdb_funcs import ifdb_push
+from tools.result_store import resultStore
 
 import traceback
 
@@ -42,6 +45,28 @@ def list_inis(ini_path):
     return files
 
 
+def push_fluxes(data, config, change_capture=False):
+    """
+    Push the summarized fluxes to the influxDB in the .ini
+
+    args:
+    ---
+    data -- fluxCalculator
+    config -- configparser.ConfigParser
+    change_capture -- bool
+        Only push rows that are new or changed since the last push, their
+        fingerprints are stored in <name>_db_fingerprints.csv
+    """
+    ifdb_dict = dict(config.items("influxDB"))
+    tag_columns = ifdb_dict.get("tag_columns")
+    if tag_columns:
+        tag_columns = [col.strip() for col in tag_columns.split(",")]
+    fp_path = None
+    if change_capture:
+        fp_path = f"{data.ini_handler.ini_name}_db_fingerprints.csv"
+    ifdb_push(data.ready_data, ifdb_dict, tag_columns or None, fp_path)
+
+
 @timer
 def class_calc(inifile, env_vars):
     config = configparser.ConfigParser(env_vars, allow_no_value=True)
@@ -70,7 +95,23 @@ def class_calc(inifile, env_vars):
     log_level = dict(config.items("defaults")).get("logging_level")
     init_logger(log_level)
     data = fluxCalculator(inifile, env_vars, instr_class, meas_class)
-    data.ready_data.to_csv(f"{data.ini_handler.ini_name}_flux.csv")
+    if defs.get("push_to_db") == "1":
+        push_fluxes(data, config, defs.get("change_capture") == "1")
+    store_fmt = defs.get("result_store")
+    if store_fmt:
+        store_path = defs.get("result_store_path")
+        store_path = store_path or f"{data.ini_handler.ini_name}_results"
+        resultStore(store_path, store_fmt).append(data.ready_data)
+        # with a result store the .csv is only written if asked for
+        if defs.get("write_csv") != "1":
+            return data
+    flux_csv = f"{data.ini_handler.ini_name}_flux.csv"
+    if defs.get("change_capture") == "1":
+        # only write rows that are new or changed since the last run
+        fp_csv = f"{data.ini_handler.ini_name}_fingerprints.csv"
+        write_changed_csv(data.ready_data, flux_csv, fp_csv)
+    else:
+        data.ready_data.to_csv(flux_csv)
 
     return data
 
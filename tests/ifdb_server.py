@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+"""
+Local stand-in for the parts of the influxDB v2 http api used by
+tools/influxdb_funcs.py. Serves synthetic 1 Hz data for every queried field
+and accepts writes, so the database paths can be tested and benchmarked
+without a live server.
+"""
+
+import re
+import gzip
+import json
+import time
+import threading
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+CHUNK_ROWS = 10000
+
+
+def parse_ts(value, now):
+    value = value.strip()
+    if value == "now()":
+        return now
+    if value == "0":
+        return np.datetime64(0, "s")
+    return np.datetime64(value.rstrip("Z"), "s")
+
+
+def parse_query(query, now):
+    """Pull the parts this stand-in understands out of a flux query."""
+    start, stop = re.search(r"range\(start: ([^,]+), stop: (now\(\)|[^)]+)\)", query).groups()
+    return {
+        "bucket": re.search(r'from\(bucket: "([^"]+)"\)', query).group(1),
+        "start": parse_ts(start, now),
+        "stop": parse_ts(stop, now),
+        "measurement": re.search(r'r\["_measurement"\] == "([^"]+)"', query).group(1),
+        "fields": re.findall(r'r\["_field"\] == "([^"]+)"', query),
+        "first": "first(" in query,
+        "last": "last(" in query,
+        "pivot": "pivot(" in query,
+    }
+
+
+def synthetic_values(field, times):
+    """Deterministic values for a field, a daily cycle with some noise."""
+    seed = sum(field.encode())
+    secs = times.astype("datetime64[s]").view("int64")
+    noise = np.random.default_rng(seed + int(secs[0]) if len(secs) else seed)
+    base = 400 + seed % 100
+    return base + 10 * np.sin(secs / 86400 * 2 * np.pi) + noise.normal(0, 0.5, len(secs))
+
+
+def fmt_times(times):
+    return np.char.add(np.datetime_as_string(times, unit="s"), "Z")
+
+
+class standinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        data_start="2021-10-01T00:00:00",
+        data_end="2021-10-08T00:00:00",
+        freq_s=1,
+        latency=0.0,
+        port=0,
+    ):
+        super().__init__(("127.0.0.1", port), ifdbHandler)
+        self.data_start = np.datetime64(data_start, "s")
+        self.data_end = np.datetime64(data_end, "s")
+        self.freq = np.timedelta64(freq_s, "s")
+        # seconds to wait before answering each request
+        self.latency = latency
+        self.written = []
+        self.n_queries = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def times(self, start, stop):
+        start = max(start, self.data_start)
+        stop = min(stop, self.data_end)
+        if stop <= start:
+            return np.array([], dtype="datetime64[s]")
+        # align to the data frequency
+        offset = (start - self.data_start) % self.freq
+        if offset:
+            start = start + self.freq - offset
+        return np.arange(start, stop, self.freq)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class ifdbHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        path = urlparse(self.path).path
+        if path == "/api/v2/query":
+            self.handle_query()
+        elif path == "/api/v2/write":
+            self.handle_write()
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def handle_write(self):
+        params = parse_qs(urlparse(self.path).query)
+        lines = self.read_body().decode().splitlines()
+        self.server.written.append(
+            {
+                "bucket": params.get("bucket", [None])[0],
+                "precision": params.get("precision", [None])[0],
+                "lines": [line for line in lines if line],
+            }
+        )
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def handle_query(self):
+        body = json.loads(self.read_body())
+        self.server.n_queries += 1
+        now = np.datetime64(
+            datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None), "s"
+        )
+        q = parse_query(body["query"], now)
+        annotations = body.get("dialect", {}).get(
+            "annotations", ["datatype", "group", "default"]
+        )
+        times = self.server.times(q["start"], q["stop"])
+        if q["first"]:
+            times = times[:1]
+        if q["last"]:
+            times = times[-1:]
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if len(times):
+            if q["pivot"]:
+                self.write_pivot(q, times, annotations)
+            else:
+                self.write_tables(q, times, annotations)
+        self.write_chunk(b"")
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+    def write_header(self, columns, datatypes, annotations, table_start=False):
+        lines = []
+        if table_start:
+            lines.append("")
+        if "datatype" in annotations:
+            lines.append(",".join(["#datatype"] + datatypes))
+        if "group" in annotations:
+            lines.append(",".join(["#group"] + ["false"] * len(datatypes)))
+        if "default" in annotations:
+            lines.append(",".join(["#default", "_result"] + [""] * (len(datatypes) - 1)))
+        lines.append("," + ",".join(columns))
+        self.write_chunk(("\r\n".join(lines) + "\r\n").encode())
+
+    def write_pivot(self, q, times, annotations):
+        start = fmt_times(np.array([times[0]]))[0]
+        stop = fmt_times(np.array([times[-1]]))[0]
+        columns = ["result", "table", "_start", "_stop", "_time", "_measurement"]
+        columns += q["fields"]
+        datatypes = ["string", "long"] + ["dateTime:RFC3339"] * 3 + ["string"]
+        datatypes += ["double"] * len(q["fields"])
+        self.write_header(columns, datatypes, annotations)
+        values = [synthetic_values(f, times) for f in q["fields"]]
+        prefix = f",_result,0,{start},{stop},"
+        # _measurement comes after _time
+        for i in range(0, len(times), CHUNK_ROWS):
+            ts = fmt_times(times[i : i + CHUNK_ROWS])
+            rows = np.char.add(np.char.add(prefix, ts), f",{q['measurement']}")
+            for vals in values:
+                col = vals[i : i + CHUNK_ROWS].round(3).astype(str)
+                rows = np.char.add(np.char.add(rows, ","), col)
+            self.write_chunk(("\r\n".join(rows.tolist()) + "\r\n").encode())
+
+    def write_tables(self, q, times, annotations):
+        start = fmt_times(np.array([times[0]]))[0]
+        stop = fmt_times(np.array([times[-1]]))[0]
+        columns = [
+            "result",
+            "table",
+            "_start",
+            "_stop",
+            "_time",
+            "_value",
+            "_field",
+            "_measurement",
+        ]
+        datatypes = ["string", "long"] + ["dateTime:RFC3339"] * 3
+        datatypes += ["double", "string", "string"]
+        for n, field in enumerate(q["fields"]):
+            self.write_header(columns, datatypes, annotations, table_start=n > 0)
+            values = synthetic_values(field, times).round(3).astype(str)
+            rows = np.char.add(f",_result,{n},{start},{stop},", fmt_times(times))
+            rows = np.char.add(np.char.add(rows, ","), values)
+            rows = np.char.add(rows, f",{field},{q['measurement']}")
+            self.write_chunk(("\r\n".join(rows.tolist()) + "\r\n").encode())
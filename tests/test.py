@@ -1,24 +1,68 @@
+import os
+import datetime
 import pytest
-from tools.time_funcs import time_to_numeric
+import numpy as np
+import pandas as pd
+from tools.time_funcs import (
+    time_to_numeric,
+    datetime_to_epoch,
+    datetime_to_ordinal,
+    datetime_to_numeric,
+    datetime_to_strings,
+    parse_datetimes,
+    parse_date_and_time,
+    compile_timestamp_format,
+)
 
 # test_with_unittest discover
 import main
-from tools.validation import check_air_temp_col
+from tools.validation import check_air_temp_col, overlap_test, overlap_counts
+from tools.chamber_cycle import read_cycle_template, mk_cycle_calendar
 from tools.file_tools import (
     read_man_meas_f,
     filter_between_dates,
     find_files,
     mk_date_dict,
     get_files,
+    combine_sorted,
 )
 from tools.gas_funcs import (
     calculate_pearsons_r,
     calculate_slope,
     calculate_gas_flux,
 )
-from tools.filter import mk_fltr_tuples
-from tools.fluxer import li7810
-from tools.measurement import measurement
+from tools.filter import mk_fltr_tuples, date_filter, segmentOffsets
+from tools.fluxer import li7810, fluxCalculator
+from tools.measurement import measurement, measurementView, measurementResults
+from tools.fingerprint import filter_changed, read_fingerprints, write_changed_csv
+from tools.create_excel import (
+    create_fig,
+    create_rects,
+    create_sparkline,
+    render_sparkline_batches,
+)
+from tools.sparkline import raster_sparkline
+from tools.sparkline_cache import sparklineCache
+from tools.result_store import resultStore
+from tools.compact import float32_exact, compact_gas_frame, restore_dtypes
+from tools.merging import (
+    aggregate_by_window,
+    merge_aux_cfgs,
+    merge_by_dtx,
+    merge_by_id,
+    merge_by_dtx_and_id,
+    measurement_values,
+    join_measurement_table,
+)
+from tools.aux_data_reader import prune_files, read_files
+from tools.influxdb_funcs import (
+    decode_annotated_csv,
+    read_ifdb,
+    check_oldest_db_ts,
+    cached_query_ifdb,
+    ifdb_push,
+)
+from tests.ifdb_server import standinServer
 
 
 from tests.test_data import (
@@ -37,6 +81,7 @@ from tests.test_data import (
     ac_f,
     man_time_df,
     expected_tuple,
+    mk_test_ini,
 )
 
 
@@ -298,3 +343,565 @@ def test_def_temp(input, expected):
 # main_snow_test_df.set_index("datetime", inplace=True)
 #
 # aux_snow_test_df, _ = read_snow_measurement("tests/snow_test_for_function.xlsx")
+
+
+def test_filter_changed():
+    df = pd.DataFrame(
+        {"chamber": [1, 2, 1], "CH4_flux": [0.1, 0.2, 0.3]},
+        index=pd.to_datetime(
+            ["2021-10-03 00:00", "2021-10-03 00:15", "2021-10-03 00:30"]
+        ),
+    )
+    changed, fps = filter_changed(df, None)
+    assert len(changed) == 3
+    changed, _ = filter_changed(df, fps)
+    assert changed.empty
+    df.iloc[1, 1] = 0.5
+    changed, _ = filter_changed(df, fps)
+    assert changed["CH4_flux"].tolist() == [0.5]
+
+
+def test_write_changed_csv(tmp_path):
+    path = tmp_path / "flux.csv"
+    fp_path = tmp_path / "fingerprints.csv"
+    df = pd.DataFrame(
+        {"chamber": [1, 2, 1], "CH4_flux": [0.1, 0.2, 0.3]},
+        index=pd.DatetimeIndex(
+            ["2021-10-03 00:00", "2021-10-03 00:15", "2021-10-03 00:30"],
+            name="datetime",
+        ),
+    )
+    write_changed_csv(df.iloc[:2], path, fp_path)
+    # the next run has a changed row and a new one, each row is in the .csv
+    # once with its latest values
+    df.iloc[1, 1] = 0.5
+    write_changed_csv(df.iloc[1:], path, fp_path)
+    assert path.read_text() == df.to_csv()
+    # a run with only new rows appends them and leaves the file as it was
+    new = pd.DataFrame(
+        {"chamber": [2, 1], "CH4_flux": [0.4, 0.6]},
+        index=pd.DatetimeIndex(
+            ["2021-10-03 00:45", "2021-10-03 01:00"], name="datetime"
+        ),
+    )
+    before = path.read_bytes()
+    fps_before = fp_path.read_bytes()
+    write_changed_csv(pd.concat([df.iloc[2:], new]), path, fp_path)
+    assert path.read_bytes().startswith(before)
+    assert fp_path.read_bytes().startswith(fps_before)
+    df = pd.concat([df, new])
+    assert path.read_text() == df.to_csv()
+    # the fingerprints of the appended rows are found on the next run
+    write_changed_csv(df, path, fp_path)
+    assert path.read_text() == df.to_csv()
+    assert filter_changed(df, read_fingerprints(fp_path))[0].empty
+
+
+def test_decode_annotated_csv():
+    rows = [
+        ["#datatype", "string", "long", "dateTime:RFC3339Nano", "double", "double"],
+        ["", "result", "table", "_time", "CO2", "CH4"],
+        ["", "_result", "0", "2021-10-03T00:00:00Z", "450.1", "2300.5"],
+        ["", "_result", "0", "2021-10-03T00:00:01.5Z", "451.1", ""],
+    ]
+    df = decode_annotated_csv(rows, ["CO2", "CH4"])
+    assert df.columns.tolist() == ["datetime", "CO2", "CH4"]
+    assert df["CO2"].tolist() == [450.1, 451.1]
+    assert pd.isna(df["CH4"].iloc[1])
+    assert datetime_to_epoch(df["datetime"].values).tolist() == [
+        1633219200.0,
+        1633219201.5,
+    ]
+
+
+def test_datetime_to_numeric():
+    times = pd.date_range("2021-10-03 23:59:58", periods=4, freq="750ms")
+    dates, hms = datetime_to_strings(times.values)
+    assert dates.tolist() == ["2021-10-03"] * 3 + ["2021-10-04"]
+    assert hms.tolist() == ["23:59:58", "23:59:58", "23:59:59", "00:00:00"]
+    assert datetime_to_ordinal(times.values).tolist() == [
+        t.toordinal() for t in times
+    ]
+    assert datetime_to_numeric(times.values).tolist() == time_to_numeric(hms).tolist()
+
+
+def test_parse_fixed_width():
+    hms = np.array(["00:00:01", "12:34:56", "23:59:59"], dtype=object)
+    assert time_to_numeric(hms).tolist() == [1, 45296, 86399]
+    # no fixed width, parsed one by one
+    assert time_to_numeric(np.array(["7:05:03"])).tolist() == [25503]
+    dts = np.array(["2024-02-2923:59:59", "2021-10-0300:00:00"])
+    expected = pd.to_datetime(dts, format="%Y-%m-%d%H:%M:%S").to_numpy()
+    assert (parse_datetimes(dts, "%Y-%m-%d%H:%M:%S") == expected).all()
+    # not a leap year
+    invalid = np.array(["2023-02-2900:00:00"])
+    assert parse_datetimes(invalid, "%Y-%m-%d%H:%M:%S") is None
+    short = parse_datetimes(np.array(["2110031205"]), "%y%m%d%H%M")
+    assert short[0] == pd.Timestamp("2021-10-03 12:05")
+    parsed = parse_date_and_time(
+        np.array(["2021-10-03"]), np.array(["12:05:00"]), "%Y-%m-%d", "%H:%M:%S"
+    )
+    assert parsed[0] == pd.Timestamp("2021-10-03 12:05")
+
+
+def test_read_ifdb_standin():
+    with standinServer() as srv:
+        ifdb_dict = {"url": srv.url, "token": "t", "organization": "o", "bucket": "b"}
+        meas_dict = {"measurement": "licor", "fields": "CO2,CH4"}
+        start = datetime.datetime(2021, 10, 3)
+        df = read_ifdb(
+            ifdb_dict, meas_dict, start, start + datetime.timedelta(minutes=10)
+        )
+        assert len(df) == 600
+        assert df.index[0] == pd.Timestamp(start)
+        assert df["numeric_datetime"].iloc[0] == 1633219200.0
+        oldest = check_oldest_db_ts(ifdb_dict, meas_dict, ["CO2", "CH4"])
+        assert oldest == datetime.datetime(2021, 10, 1)
+
+
+def test_cached_query_server_down(tmp_path):
+    srv = standinServer()
+    port = srv.server_address[1]
+    ifdb_dict = {"url": srv.url, "token": "t", "organization": "o"}
+    ifdb_dict["cache_dir"] = str(tmp_path)
+    start = datetime.datetime(2021, 10, 3)
+    stop = start + datetime.timedelta(minutes=10)
+    srv.server_close()
+    # a failed query isn't cached as a range without data
+    assert cached_query_ifdb(ifdb_dict, "b", "licor", ["CO2"], start, stop) is None
+    with standinServer(port=port) as srv:
+        df = cached_query_ifdb(ifdb_dict, "b", "licor", ["CO2"], start, stop)
+        assert len(df) == 600
+        assert srv.n_queries == 1
+        df = cached_query_ifdb(ifdb_dict, "b", "licor", ["CO2"], start, stop)
+        assert len(df) == 600
+        assert srv.n_queries == 1
+
+
+def test_ifdb_push_changed(tmp_path):
+    fp_path = tmp_path / "db_fingerprints.csv"
+    df = pd.DataFrame(
+        {"chamber": [1, 2], "CH4_flux": [0.1, 0.2]},
+        index=pd.DatetimeIndex(["2021-10-03 00:00", "2021-10-03 00:15"]),
+    )
+    with standinServer() as srv:
+        ifdb_dict = {"url": srv.url, "token": "t", "organization": "o", "bucket": "b"}
+        ifdb_dict["measurement_name"] = "fluxes"
+        ifdb_push(df, ifdb_dict, ["chamber"], fp_path)
+        ifdb_push(df, ifdb_dict, ["chamber"], fp_path)
+        df.iloc[1, 1] = 0.5
+        ifdb_push(df, ifdb_dict, ["chamber"], fp_path)
+        lines = [w["lines"] for w in srv.written]
+    # the second push has nothing new, the third only the changed row
+    assert [len(batch) for batch in lines] == [2, 1]
+    assert lines[1][0].startswith("fluxes,chamber=2 CH4_flux=0.5")
+
+
+def test_aggregate_by_window():
+    aux = pd.DataFrame(
+        {
+            "chamber": [1, 2, 1, 2, 1],
+            "air_temperature": [10.0, 20.0, 12.0, 22.0, 30.0],
+        },
+        index=pd.to_datetime(
+            [
+                "2021-10-03 00:00:30",
+                "2021-10-03 00:00:40",
+                "2021-10-03 00:01:30",
+                "2021-10-03 00:01:40",
+                "2021-10-03 00:20:00",
+            ]
+        ),
+    )
+    cfg = {"df": aux, "name": "air_temperature", "tolerance": "5min"}
+    starts = pd.to_datetime(
+        [
+            "2021-10-03 00:00",
+            "2021-10-03 00:00",
+            "2021-10-03 00:04",
+            "2021-10-03 01:00",
+        ]
+    )
+    time_df = pd.DataFrame(
+        {
+            "start_time": starts,
+            "close_time": starts,
+            "open_time": starts + pd.Timedelta(minutes=2),
+            "end_time": starts + pd.Timedelta(minutes=2),
+            "chamber": [1, 2, 1, 1],
+        }
+    )
+    ms = mk_fltr_tuples(time_df)
+    stats = aggregate_by_window(cfg, ms, "chamber")
+    assert stats["air_temperature"].tolist()[:3] == [11.0, 21.0, 12.0]
+    assert stats["air_temperature_max"].tolist()[:2] == [12.0, 22.0]
+    assert stats["air_temperature_count"].tolist() == [2, 2, 0, 0]
+    assert stats["t_dif_air_temperature"].tolist()[:3] == [0.0, 0.0, 150.0]
+    assert pd.isna(stats["air_temperature"].iloc[3])
+
+
+def test_prune_aux_files():
+    files = [f"met_2021100{d}.dat" for d in range(1, 8)]
+    cfg = {"files": files, "file_timestamp_format": "%Y%m%d"}
+    window = (datetime.datetime(2021, 10, 3, 12), datetime.datetime(2021, 10, 5))
+    assert prune_files(cfg, window) == files[2:5]
+    assert prune_files(cfg, None) == files
+
+
+def test_read_aux_files_window(tmp_path, monkeypatch):
+    times = pd.date_range("2021-10-01", periods=1000, freq="min", name="datetime")
+    path = tmp_path / "met.csv"
+    pd.DataFrame({"air_temperature": np.arange(1000.0)}, index=times).to_csv(path)
+    # the end of the file is never parsed
+    with open(path, "a") as f:
+        f.write("not,a,row\n")
+    cfg = {
+        "name": "air_temperature",
+        "files": [path],
+        "args": {"index_col": "datetime", "parse_dates": True},
+        "merge_method": "time",
+        "tolerance": "10min",
+    }
+    concatenated = []
+
+    def concat(frames, *args, **kwargs):
+        frames = list(frames)
+        concatenated.extend(frames)
+        return real_concat(frames, *args, **kwargs)
+
+    real_concat = pd.concat
+    monkeypatch.setattr("tools.aux_data_reader.CHUNK_ROWS", 100)
+    monkeypatch.setattr(pd, "concat", concat)
+    start = datetime.datetime(2021, 10, 1, 3)
+    df = read_files(cfg, start, start + datetime.timedelta(hours=1))
+    expected = times[(times >= "2021-10-01 02:50") & (times <= "2021-10-01 04:10")]
+    assert df.index.equals(expected)
+    # rows outside of the window are dropped before the chunks are combined
+    assert all(frame.index.isin(expected).all() for frame in concatenated)
+
+
+def test_merge_aux_cfgs():
+    idx = pd.date_range("2021-10-01", periods=600, freq="s", name="datetime")
+    main_df = pd.DataFrame(
+        {"chamber": (idx.minute % 3).astype(object), "CO2": range(600)}, index=idx
+    )
+    temp = pd.DataFrame(
+        {"air_temperature": [1.0, 2.0, 3.0]},
+        index=pd.date_range("2021-10-01", periods=3, freq="4min", name="datetime"),
+    )
+    snow = pd.DataFrame(
+        {"chamber": [0, 1, 2, 0], "snowdepth": [5.0, 6.0, 7.0, 8.0]},
+        index=pd.date_range("2021-10-01", periods=4, freq="3min", name="datetime"),
+    )
+    plots = pd.DataFrame({"chamber": [0, 1], "plot": ["a", "b"]})
+    cfgs = [
+        {"name": "t", "merge_method": "time", "df": temp, "tolerance": "1min"},
+        {"name": "s", "merge_method": "timeid", "df": snow, "tolerance": "1h"},
+        {"name": "p", "merge_method": "id", "df": plots},
+    ]
+    expected = main_df.copy()
+    expected = merge_by_dtx(expected, {**cfgs[0], "df": temp.copy()})
+    expected = merge_by_dtx_and_id(expected, {**cfgs[1], "df": snow.copy()})
+    expected = merge_by_id(expected, cfgs[2])
+    merged = merge_aux_cfgs(main_df.copy(), cfgs)
+    pd.testing.assert_frame_equal(merged, expected)
+    # the id columns of the inputs keep their dtypes
+    assert main_df["chamber"].dtype == object
+    assert snow["chamber"].dtype == np.int64
+
+
+def test_join_measurement_table():
+    idx = pd.date_range("2021-10-03", periods=4, freq="s", name="datetime")
+    df = pd.DataFrame(
+        {"CO2": [1.0, 2.0, 3.0, 4.0], "measurement_id": [0, 0, 1, -1], "flux": 0.1},
+        index=idx,
+    )
+    meas_table = pd.DataFrame({"chamber": [3, 4], "overlap": [False, True]})
+    joined = join_measurement_table(df, meas_table)
+    assert joined.columns.tolist() == ["CO2", "chamber", "overlap", "flux"]
+    assert joined["chamber"].tolist()[:3] == [3, 3, 4]
+    assert pd.isna(joined["chamber"].iloc[3])
+    assert measurement_values(df.iloc[:3], meas_table, "overlap").any()
+
+
+def test_measurement_table():
+    ms = mk_fltr_tuples(man_time_df.head(3))
+    assert len(ms) == 3
+    row = ms[1]
+    assert row.start == man_time_df["start_time"].iloc[1]
+    assert row.plot_end == man_time_df["end_time"].iloc[1] + pd.Timedelta(minutes=2)
+    assert row.id == man_time_df["chamber"].iloc[1]
+    assert [m.close for m in ms] == man_time_df["close_time"].head(3).tolist()
+    index = pd.DatetimeIndex(man_time_df["start_time"].head(3)) + pd.Timedelta(
+        seconds=1
+    )
+    starts, ends = ms.locate(index)
+    assert starts.tolist() == [0, 1, 2]
+    assert ends.tolist() == [1, 2, 3]
+
+
+def test_segment_offsets():
+    ms = mk_fltr_tuples(man_time_df.head(3))
+    start = man_time_df["start_time"].iloc[0] - pd.Timedelta(minutes=5)
+    index = pd.date_range(start, man_time_df["end_time"].iloc[2], freq="10s")
+    df = pd.DataFrame({"value": range(len(index))}, index=index)
+    segments = segmentOffsets(df, ms)
+    for i, m in enumerate(ms):
+        for window, (s_key, e_key) in segments.windows.items():
+            expected = date_filter(df, m, s_key, e_key)
+            assert segments.slice(df, i, window).equals(expected)
+    assert segments.fits(df)
+    assert not segments.fits(df.iloc[1:])
+    # same number of rows at other times
+    assert not segments.fits(df.shift(freq="1s"))
+    # the gas data ends before the last measurement starts
+    short = df.loc[: ms[1].end]
+    positions, rows = segmentOffsets(short, ms).first_rows()
+    assert rows.tolist() == [0, 1]
+    expected = [date_filter(short, m).iloc[0].name for m in ms[:2]]
+    assert short.index[positions].tolist() == expected
+
+
+def test_measurement_view_and_results():
+    df = pd.DataFrame({"CO2": [1.0, 2.0, 3.0, 4.0], "air_pressure": 1000.0})
+    arrays = {col: df[col].to_numpy() for col in df.columns}
+    view = measurementView(arrays, 1, 3, {"air_temperature": 10.0})
+    assert len(view) == 2 and not view.empty
+    assert view["CO2"].tolist() == [2.0, 3.0]
+    assert view["air_temperature"].tolist() == [10.0, 10.0]
+    assert "air_temperature" in view and "CH4" not in view
+
+    results = measurementResults(3, ["snowdepth", "CO2_flux"], ["snowdepth"])
+    results.set(0, snowdepth=0, CO2_flux=1.5)
+    results.set(2, snowdepth=0, CO2_flux=2.5)
+    summary = pd.DataFrame({"CO2_flux": [9.0, 9.0]})
+    summary = results.add_to(summary, [0, 2])
+    assert summary["snowdepth"].dtype == "int64"
+    assert summary["CO2_flux"].tolist() == [1.5, 2.5]
+    summary = results.add_to(pd.DataFrame({"CO2_flux": [9.0, 9.0]}), [0, 1])
+    assert summary["CO2_flux"].tolist() == [1.5, 9.0]
+    assert summary["snowdepth"].isna().tolist() == [False, True]
+
+
+def test_cycle_calendar():
+    template = read_cycle_template("tests/ACstart_test.txt")
+    assert read_cycle_template("tests/ACstart_test.txt") is template
+    df = mk_cycle_calendar(template, ["2021-10-03", "2021-10-04"], 150, 750, 900)
+    assert len(df) == 2 * len(template)
+    assert df["datetime"].iloc[1] == pd.Timestamp("2021-10-03 00:15:00")
+    assert df["datetime"].iloc[len(template)] == pd.Timestamp("2021-10-04")
+    assert df["close_time"].iloc[0] == pd.Timestamp("2021-10-03 00:02:30")
+    assert df["end_time"].iloc[0] == pd.Timestamp("2021-10-03 00:15:00")
+    assert df["date"].iloc[-1] == "2021-10-04"
+    df.loc[1, "end_time"] = pd.Timestamp("2021-10-03 00:31:00")
+    tested = overlap_test(df, "li_id")
+    assert tested["overlap"].tolist()[:4] == [False, True, True, False]
+    assert tested["overlap_count"].tolist()[:4] == [0, 1, 1, 0]
+    # cycles of different instruments don't overlap
+    df["li_id"] = ["TG10-01143", "TG10-01144"] * (len(df) // 2)
+    assert not overlap_test(df, "li_id")["overlap"].any()
+
+
+def test_overlap_counts():
+    starts = pd.Timestamp("2021-10-03") + pd.to_timedelta(
+        [0, 5, 20, 40, 50], unit="min"
+    )
+    ends = starts + pd.to_timedelta([60, 10, 10, 10, 10], unit="min")
+    # the first cycle spans all the others
+    assert overlap_counts(starts, ends).tolist() == [4, 1, 1, 1, 1]
+    groups = ["a", "b", "b", "b", "a"]
+    assert overlap_counts(starts, ends, groups).tolist() == [1, 0, 0, 0, 1]
+    # touching cycles don't overlap
+    touching = overlap_counts(starts[1:3], starts[1:3] + pd.Timedelta(minutes=15))
+    assert touching.tolist() == [0, 0]
+
+
+def test_timestamp_format():
+    fmt = compile_timestamp_format("%y%m%d")
+    assert compile_timestamp_format("%y%m%d") is fmt
+    assert fmt.extract("meas_211003.csv") == datetime.datetime(2021, 10, 3)
+    assert fmt.extract("meas.csv") is None
+    assert fmt.parse_all(["211003", "991231"]) == [
+        datetime.datetime(2021, 10, 3),
+        datetime.datetime(1999, 12, 31),
+    ]
+    with pytest.raises(ValueError):
+        fmt.parse("211332")
+    # not fixed width, parsed with strptime
+    fmt = compile_timestamp_format("%d%b%Y")
+    assert fmt.layout is None
+    assert fmt.extract("x_03Oct2021") == datetime.datetime(2021, 10, 3)
+
+
+def test_combine_sorted():
+    def frame(start, periods, value):
+        times = pd.date_range(start, periods=periods, freq="s")
+        return pd.DataFrame({"datetime": times, "value": value})
+
+    day1 = frame("2021-10-03", 5, 1)
+    day2 = frame("2021-10-04", 5, 2)
+    # files in any order are appended in time order
+    df = combine_sorted([day2, day1])
+    assert df.index.is_monotonic_increasing
+    assert df["value"].tolist() == [1] * 5 + [2] * 5
+    # overlapping rows that the earlier file already has are dropped
+    late = frame("2021-10-03 00:00:03", 4, 3)
+    df = combine_sorted([day1, late])
+    assert df.index.is_monotonic_increasing and df.index.is_unique
+    assert df["value"].tolist() == [1] * 5 + [3] * 2
+    # unsorted frames are sorted
+    df = combine_sorted([day1.iloc[::-1]])
+    assert df.index.equals(pd.DatetimeIndex(day1["datetime"], name="datetime"))
+
+
+def test_compact_gas_frame():
+    times = pd.date_range("2021-10-03", periods=6, freq="s")
+    co2 = np.array([401.123, 402.456, 403.789, 404.001, 405.5, 406.25])
+    df = pd.DataFrame(
+        {
+            "CO2": co2,
+            "DIAG": np.zeros(6, dtype=np.int64),
+            "gas_file": ["a.data"] * 6,
+            "checks": "",
+        },
+        index=times,
+    )
+    assert float32_exact(co2, 3)
+    assert not float32_exact(co2 + 1e-7, 3)
+    float32_cols, int_cols = compact_gas_frame(df, ["CO2"], 3, "DIAG")
+    assert float32_cols == {"CO2": 3}
+    assert int_cols == {"DIAG": np.int64}
+    assert df["CO2"].dtype == np.float32 and df["DIAG"].dtype == np.int8
+    assert isinstance(df["gas_file"].dtype, pd.CategoricalDtype)
+    # the values used in the calculations are the original ones
+    view = measurementView({"CO2": df["CO2"].to_numpy()}, 1, 5, decimals=float32_cols)
+    assert (view["CO2"].to_numpy() == co2[1:5]).all()
+    restore_dtypes(df, float32_cols, int_cols)
+    assert (df["CO2"].to_numpy() == co2).all()
+    assert df["DIAG"].dtype == np.int64
+    assert not isinstance(df["gas_file"].dtype, pd.CategoricalDtype)
+
+
+def test_compact_dtypes_pipeline(tmp_path):
+    ready = []
+    for compact in (0, 1):
+        ini = mk_test_ini(
+            tmp_path / str(compact), compact_dtypes=compact, create_excel=0
+        )
+        ready.append(fluxCalculator(ini, None).ready_data)
+    default, compact = ready
+    for gas in ["CO2", "CH4"]:
+        for col in [f"{gas}_flux", f"{gas}_slope", f"{gas}_pearsons_r"]:
+            pd.testing.assert_series_equal(compact[col], default[col])
+    assert compact["DIAG"].dtype == default["DIAG"].dtype
+
+
+def test_create_xlsx(tmp_path):
+    ini = mk_test_ini(tmp_path, sparkline_backend="raster")
+    data = fluxCalculator(ini, None)
+    days = sorted(data.ready_data.index.strftime("%Y%m%d").unique())
+    excels = sorted(p.name for p in (tmp_path / "exc_out").iterdir())
+    assert excels == [f"{day}.xlsx" for day in days] + ["all_data_202110.xlsx"]
+    figs = data.ready_data["fig_dir_CO2"].dropna()
+    assert len(figs) and all(
+        path.startswith(str(tmp_path / "figs")) and os.path.exists(path)
+        for path in figs
+    )
+
+
+def test_render_sparkline_batches(tmp_path):
+    ms = mk_fltr_tuples(man_time_df.head(2))
+    batches = []
+    for m in ms:
+        index = pd.date_range(m.plot_start, m.plot_end, freq="10s")
+        df = pd.DataFrame({"CO2": np.linspace(400, 420, len(index))}, index=index)
+        fig_path = str(tmp_path / f"{m.start.strftime('%Y%m%d%H%M%S')}.png")
+        batches.append([(fig_path, df, "CO2", create_rects(df["CO2"], m))])
+    # a task that fails doesn't stop the rest of the batch
+    batches[0].insert(0, (str(tmp_path / "bad.png"), None, "CO2", None))
+    done = render_sparkline_batches(batches, workers=1)
+    assert done == {batch[-1][0] for batch in batches}
+    assert all(os.path.exists(path) for path in done)
+    assert not (tmp_path / "bad.png").exists()
+
+
+def test_raster_sparkline(tmp_path):
+    import matplotlib.image
+
+    m = mk_fltr_tuples(man_time_df.head(1))[0]
+    index = pd.date_range(m.plot_start, m.plot_end, freq="s")
+    co2 = 400 + np.sin(np.linspace(0, 6, len(index))) * 10
+    df = pd.DataFrame({"CO2": co2}, index=index)
+    rects = create_rects(df["CO2"], m)
+    fig, ax = create_fig()
+    create_sparkline(df, tmp_path / "mpl.png", "CO2", fig, ax, rects)
+    raster_sparkline(df, tmp_path / "raster.png", "CO2", rects)
+    expected = matplotlib.image.imread(tmp_path / "mpl.png")
+    image = matplotlib.image.imread(tmp_path / "raster.png")
+    assert image.shape == expected.shape
+    assert np.abs(image - expected).mean() < 0.03
+
+
+def test_sparkline_cache(tmp_path):
+    index = pd.date_range("2021-10-03 02:00", periods=5, freq="min")
+    df = pd.DataFrame({"CO2": [1.0, 2.0, 3.0, 2.0, 1.0]}, index=index)
+    rects = (0, 1, 0.2, 0.5, 1.0, 2.0)
+    fig_path = str(tmp_path / "20211003020500.png")
+    orphan = tmp_path / "20211003021000.png"
+    outside = tmp_path / "20211004020500.png"
+    # a png this cache didn't render, eg. of another .ini
+    other = tmp_path / "20211003021500.png"
+    start = pd.Timestamp("2021-10-03 02:05")
+    end = start + pd.Timedelta("1h")
+
+    cache = sparklineCache("raster")
+    for path in (fig_path, orphan, outside):
+        assert not cache.check(path, df, "CO2", rects)
+        raster_sparkline(df, path, "CO2", rects)
+    raster_sparkline(df, other, "CO2", rects)
+    expected = {fig_path, str(orphan), str(outside)}
+    assert cache.update(expected) == expected
+    cache.save()
+
+    # the orphan isn't in the next run anymore
+    cache = sparklineCache("raster")
+    assert cache.check(fig_path, df, "CO2", rects)
+    assert cache.remove_orphans([tmp_path], start, end, {fig_path}) == 1
+    assert not orphan.exists() and outside.exists() and other.exists()
+    cache.save()
+
+    # the next run only renders sparklines that have changed
+    cache = sparklineCache("raster")
+    assert cache.check(fig_path, df, "CO2", rects)
+    assert not cache.check(fig_path, df * 2, "CO2", rects)
+    assert not sparklineCache("matplotlib").check(fig_path, df, "CO2", rects)
+
+
+def mk_fluxes(start, periods, flux):
+    index = pd.date_range(start, periods=periods, freq="12h", name="datetime")
+    return pd.DataFrame(
+        {"chamber": np.arange(periods) % 2 + 1, "CO2_flux": flux}, index=index
+    )
+
+
+@pytest.mark.parametrize("fmt", ["pickle", "parquet"])
+def test_result_store(tmp_path, fmt):
+    if fmt != "pickle":
+        pytest.importorskip("pyarrow")
+    store = resultStore(tmp_path, fmt)
+    assert store.append(mk_fluxes("2021-10-03", 4, 1.0)) == 4
+    # rows with the same datetime are replaced, the others are kept
+    assert store.append(mk_fluxes("2021-10-04", 4, 2.0)) == 4
+    assert (tmp_path / "date=2021-10-03" / "chamber=1").is_dir()
+    assert not list(tmp_path.rglob("*.tmp"))
+
+    df = store.read()
+    assert df.index.is_monotonic_increasing and df.index.is_unique
+    assert df["CO2_flux"].tolist() == [1.0, 1.0, 2.0, 2.0, 2.0, 2.0]
+    df = store.read(start="2021-10-04", chambers=[1], columns=["CO2_flux"])
+    assert df.columns.tolist() == ["CO2_flux"]
+    assert df.index.strftime("%Y-%m-%d %H").tolist() == [
+        "2021-10-04 00",
+        "2021-10-05 00",
+    ]
+    assert store.read(start="2022-01-01").empty
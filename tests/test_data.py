@@ -2,7 +2,11 @@ import pandas as pd
 import numpy as np
 import sys
 from pathlib import Path
+import atexit
+import shutil
 import datetime
+import tempfile
+import configparser
 from tools.time_funcs import time_to_numeric
 import pytest
 
@@ -56,8 +60,32 @@ man_ini_path = "tests/inis/test_ini_man.ini"
 env_vars = None
 ac_ini_path = "tests/inis/test_ini_ac.ini"
 
-man_f = fluxCalculator(man_ini_path, env_vars)
-ac_f = fluxCalculator(man_ini_path, env_vars)
+
+def mk_test_ini(out_dir, ini_path=man_ini_path, **defaults):
+    """
+    Copy of a test .ini in out_dir with its excels and sparklines written
+    to out_dir and the given [defaults] values changed
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cfg = configparser.RawConfigParser()
+    cfg.read(ini_path)
+    cfg["defaults"]["excel_directory"] = str(out_dir / "exc_out")
+    cfg["defaults"]["fig_directory"] = str(out_dir / "figs")
+    for key, value in defaults.items():
+        cfg["defaults"][key] = str(value)
+    path = out_dir / Path(ini_path).name
+    with open(path, "w") as f:
+        cfg.write(f)
+    return str(path)
+
+
+# output of the runs below, removed when the tests are done
+test_out = Path(tempfile.mkdtemp(prefix="fluxer_test_"))
+atexit.register(shutil.rmtree, test_out, ignore_errors=True)
+
+man_f = fluxCalculator(mk_test_ini(test_out / "man"), env_vars)
+ac_f = fluxCalculator(mk_test_ini(test_out / "ac"), env_vars)
 
 test_data_path = "tests/data/measurement_data/"
 test_data_files = [
@@ -62,6 +62,10 @@ def parse_file_cfg(cfg):
     merge_method = cfg.get("merge_method")
     direction = cfg.get("direction")
     tolerance = cfg.get("tolerance")
+    id_col = cfg.get("id_col")
+    aggregate = cfg.get("aggregate")
+    ts_fmt = cfg.get("file_timestamp_format")
+    time_index = cfg.get("time_index")
     # possible values in the .ini that we don't want passed to pandas
     # read_csv
     excluded = [
@@ -73,6 +77,9 @@ def parse_file_cfg(cfg):
         "tolerance",
         "type",
         "id_col",
+        "aggregate",
+        "file_timestamp_format",
+        "time_index",
     ]
 
     # create dict with pandas read_csv compatible args
@@ -86,6 +93,10 @@ def parse_file_cfg(cfg):
         "args": pd_args,
         "direction": direction,
         "tolerance": tolerance,
+        "id_col": id_col,
+        "aggregate": aggregate,
+        "file_timestamp_format": ts_fmt,
+        "time_index": time_index,
     }
     return new_dict
 
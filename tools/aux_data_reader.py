@@ -1,17 +1,25 @@
 #!/usr/bin/env python3
 
+import os
+import json
+import datetime
 import pandas as pd
 import logging
+from pathlib import Path
 from tools.influxdb_funcs import read_aux_ifdb
+from tools.time_funcs import extract_date, compile_timestamp_format
 
 logger = logging.getLogger("defaultLogger")
 
+# rows parsed at a time when reading aux files
+CHUNK_ROWS = 100000
+
 
 def read_aux_data(aux_cfgs, s_ts=None, e_ts=None):
     for f in aux_cfgs:
         # NOTE: implement better checks if data is in db or in files
         if f.get("files"):
-            dfs = read_files(f)
+            dfs = read_files(f, s_ts, e_ts)
             if isinstance(dfs.index, pd.DatetimeIndex):
                 pass
                 # dfs.index = dfs.index.tz_localize("UTC")
@@ -26,25 +34,248 @@ def read_aux_data(aux_cfgs, s_ts=None, e_ts=None):
     return aux_cfgs
 
 
-def read_files(cfg):
+def read_files(cfg, s_ts=None, e_ts=None):
+    """
+    Reads the aux files that have data between s_ts and e_ts, each file is
+    read in chunks and rows outside of the timeframe are dropped from each
+    chunk as it is read.
+
+    args:
+    ---
+    cfg -- dict
+        parsed aux cfg
+    s_ts, e_ts -- datetime.datetime
+        timeframe of the processed gas data, None reads everything
+
+    returns:
+    ---
+    pd.DataFrame
+    """
+    window = read_window(cfg, s_ts, e_ts)
+    index_path = cfg.get("time_index")
+    time_index = load_time_index(index_path)
+    files = prune_files(cfg, window, time_index)
+    argss = cfg.get("args")
+    logger.debug(cfg)
+    if len(argss) == 0:
+        logger.warning(f"No pandas arguments defined for .ini {cfg.get('name')}")
+        argss = {"header": 0}
     dfs = []
-    for file in cfg.get("files"):
-        argss = cfg.get("args")
-        logger.debug(cfg)
-        if len(argss) == 0:
-            logger.warning(f"No pandas arguments defined for .ini {cfg.get('name')}")
-            df = pd.read_csv(file, header=0)
-        else:
-            df = pd.read_csv(file, **argss)
+    for file in files:
+        entry = time_index.get(str(file))
+        # files that aren't in the time index are read to the end to index them
+        indexed = not index_path or (entry and is_index_current(file, entry))
+        df, times = read_file(file, argss, window, stop_early=indexed)
+        if index_path and times is not None:
+            time_index[str(file)] = mk_index_entry(file, *times)
         dfs.append(df)
-    if len(df) == 0:
+    if index_path:
+        save_time_index(index_path, time_index)
+    dfs = pd.concat(dfs)
+    if len(dfs) == 0:
         logger.warning(
             f"No data returned by files found for aux_data {cfg.get('name')}"
         )
-    dfs = pd.concat(dfs)
     return dfs
 
 
+def read_file(file, argss, window=None, stop_early=True, chunksize=None):
+    """
+    Reads an aux file in chunks of chunksize rows, only the rows in window
+    are kept from each chunk.
+
+    args:
+    ---
+    file -- str
+    argss -- dict
+        pandas read_csv arguments
+    window -- tuple
+        (start, end) from read_window or None
+    stop_early -- bool
+        stop reading once a sorted chunk goes past the end of window
+    chunksize -- int
+        rows parsed at a time, CHUNK_ROWS if None
+
+    returns:
+    ---
+    df -- pd.DataFrame
+        rows of the file in window
+    times -- tuple
+        first and last time of the file, None if it wasn't read to the end
+        or has no datetimeindex
+    """
+    kept = []
+    times = None
+    # the chunks so far are sorted, so later rows can't be in the window once
+    # a chunk goes past its end
+    is_sorted = True
+    end = None if window is None else window[1]
+    chunksize = chunksize or CHUNK_ROWS
+    with pd.read_csv(file, chunksize=chunksize, **argss) as reader:
+        for chunk in reader:
+            if not isinstance(chunk.index, pd.DatetimeIndex) or chunk.empty:
+                kept.append(chunk)
+                continue
+            first, last = chunk.index.min(), chunk.index.max()
+            if times is not None:
+                is_sorted = is_sorted and times[1] <= chunk.index[0]
+                first, last = min(times[0], first), max(times[1], last)
+            is_sorted = is_sorted and chunk.index.is_monotonic_increasing
+            times = (first, last)
+            if window is not None:
+                chunk = filter_window(chunk, *window)
+            kept.append(chunk)
+            if stop_early and end is not None and is_sorted and last > end:
+                return pd.concat(kept), None
+    if not kept:
+        return pd.read_csv(file, **{**argss, "nrows": 0}), None
+    return pd.concat(kept), times
+
+
+def read_window(cfg, s_ts, e_ts):
+    """
+    Timeframe of aux data needed for merging, padded with the merge tolerance
+    so rows just outside of the gas data can still be merged. Returns None if
+    the aux data isn't merged by time or there's no timeframe.
+    """
+    if cfg.get("merge_method") not in ("time", "timeid"):
+        return None
+    if s_ts is None and e_ts is None:
+        return None
+    tolerance = cfg.get("tolerance")
+    if tolerance is None:
+        tolerance = "30D"
+    pad = pd.Timedelta(tolerance).to_pytimedelta()
+    start = s_ts - pad if s_ts is not None else None
+    end = e_ts + pad if e_ts is not None else None
+    return start, end
+
+
+def filter_window(df, start, end):
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    i0 = 0 if start is None else df.index.searchsorted(start, side="left")
+    i1 = len(df) if end is None else df.index.searchsorted(end, side="right")
+    return df.iloc[i0:i1]
+
+
+def overlaps(f_start, f_end, start, end):
+    if start is not None and f_end is not None and f_end < start:
+        return False
+    if end is not None and f_start is not None and f_start > end:
+        return False
+    return True
+
+
+def file_time_ranges(files, ts_fmt):
+    """
+    Time ranges of files with a timestamp in their name, each file is assumed
+    to hold data until the timestamp of the next file.
+
+    returns:
+    ---
+    dict
+        file:(start, end), files without a matching timestamp are left out
+    """
+    dates = {}
+    if not compile_timestamp_format(ts_fmt).has_fields:
+        logger.debug(f"No strftime formatting in {ts_fmt}, can't prune files.")
+        return dates
+    for file in files:
+        try:
+            dates[file] = extract_date(ts_fmt, Path(file).name)
+        except (AttributeError, ValueError):
+            logger.debug(f"No timestamp {ts_fmt} in {file}, can't prune it.")
+    ordered = sorted(dates.items(), key=lambda item: item[1])
+    ranges = {}
+    for i, (file, start) in enumerate(ordered):
+        end = ordered[i + 1][1] if i + 1 < len(ordered) else None
+        ranges[file] = (start, end)
+    return ranges
+
+
+def prune_files(cfg, window, time_index=None):
+    """
+    Drops files that don't have data in the window, based on the timestamp in
+    the filename or the min and max times stored in the time index.
+
+    args:
+    ---
+    cfg -- dict
+        parsed aux cfg
+    window -- tuple
+        (start, end) from read_window or None
+    time_index -- dict
+        index loaded with load_time_index
+
+    returns:
+    ---
+    list
+        files to read
+    """
+    files = sorted(cfg.get("files"))
+    if window is None:
+        return files
+    start, end = window
+
+    ranges = {}
+    ts_fmt = cfg.get("file_timestamp_format")
+    if ts_fmt:
+        ranges = file_time_ranges(files, ts_fmt)
+    elif time_index:
+        for file in files:
+            entry = time_index.get(str(file))
+            if entry and is_index_current(file, entry):
+                ranges[file] = (
+                    datetime.datetime.fromisoformat(entry["min"]),
+                    datetime.datetime.fromisoformat(entry["max"]),
+                )
+
+    keep = [
+        f for f in files if f not in ranges or overlaps(*ranges[f], start, end)
+    ]
+    if not keep:
+        # read one file anyway so the columns are known
+        keep = files[:1]
+    logger.debug(
+        f"Reading {len(keep)} of {len(files)} files for aux_data {cfg.get('name')}"
+    )
+    return keep
+
+
+def load_time_index(path):
+    """Reads the per file min and max time index, {} if there isn't one."""
+    if not path or not Path(path).is_file():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_time_index(path, time_index):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(time_index, f, indent=1)
+
+
+def mk_index_entry(file, t_min, t_max):
+    stat = os.stat(file)
+    return {
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "min": t_min.isoformat(),
+        "max": t_max.isoformat(),
+    }
+
+
+def is_index_current(file, entry):
+    """Files that have changed since they were indexed need to be read."""
+    try:
+        stat = os.stat(file)
+    except OSError:
+        return False
+    return stat.st_mtime == entry["mtime"] and stat.st_size == entry["size"]
+
+
 def read_db(cfg, s_ts, e_ts):
     df = read_aux_ifdb(cfg, str(s_ts), str(e_ts))
     return df
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("defaultLogger")
+
+# parsed chamber cycle files, path: (mtime, size, template)
+_templates = {}
+
+
+class cycleTemplate:
+    """
+    One day of the chamber cycle from the chamber_cycle_file.
+
+    Parameters
+    ----------
+    times : np.array
+        The time strings of the file, eg. "00:15:00"
+
+    chambers : np.array
+        Chamber ids
+
+    offsets : np.array
+        times as int64 nanoseconds from midnight
+    """
+
+    def __init__(self, times, chambers, offsets):
+        self.times = times
+        self.chambers = chambers
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @classmethod
+    def from_file(cls, path):
+        df = pd.read_csv(path, names=["time", "chamber"])
+        times = df["time"].astype(str)
+        offsets = pd.to_timedelta(times).to_numpy().astype("timedelta64[ns]")
+        offsets = offsets.view(np.int64)
+        return cls(times.to_numpy(), df["chamber"].to_numpy(), offsets)
+
+
+def read_cycle_template(path):
+    """
+    Read the chamber_cycle_file, the file is only parsed again if its mtime
+    or size has changed.
+
+    args:
+    ---
+    path -- str or pathlib.Path
+
+    returns:
+    ---
+    cycleTemplate
+    """
+    stat = os.stat(path)
+    key = str(path)
+    cached = _templates.get(key)
+    if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+        return cached[2]
+    logger.debug(f"Parsing chamber cycle file {key}.")
+    template = cycleTemplate.from_file(path)
+    _templates[key] = (stat.st_mtime, stat.st_size, template)
+    return template
+
+
+def mk_cycle_calendar(template, dates, close_s, open_s, end_s):
+    """
+    Chamber cycles of every date, day offsets and template offsets are added
+    together in int64 nanoseconds instead of parsing each datetime.
+
+    args:
+    ---
+    template -- cycleTemplate
+    dates -- list
+        Dates as "YYYY-MM-DD" strings or datetime.date
+    close_s, open_s, end_s -- int
+        Seconds from the start of the cycle to chamber close, chamber open
+        and the end of the cycle
+
+    returns:
+    ---
+    pandas.dataframe
+        One row for each cycle of each date in the same order as dates and
+        the file, with time, chamber, date, datetime, start_time,
+        close_time, open_time and end_time columns
+    """
+    s_to_ns = 1_000_000_000
+    days = np.asarray(dates, dtype="datetime64[D]")
+    day_ns = days.astype("datetime64[ns]").view(np.int64)
+    starts = (day_ns[:, None] + template.offsets[None, :]).ravel()
+    n_days = len(days)
+
+    def to_dt(values):
+        return values.view("datetime64[ns]")
+
+    df = pd.DataFrame(
+        {
+            "time": np.tile(template.times, n_days),
+            "chamber": np.tile(template.chambers, n_days),
+            "date": np.repeat(days.astype(str), len(template)),
+            "datetime": to_dt(starts),
+        }
+    )
+    df["start_time"] = df["datetime"]
+    df["close_time"] = to_dt(starts + close_s * s_to_ns)
+    df["open_time"] = to_dt(starts + open_s * s_to_ns)
+    df["end_time"] = to_dt(starts + end_s * s_to_ns)
+    return df
@@ -3,6 +3,8 @@
 import os
 import logging
 from pathlib import Path
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 import openpyxl as opxl
 from openpyxl.utils.dataframe import dataframe_to_rows
@@ -16,18 +18,41 @@ import matplotlib.patches as patches
 from matplotlib.dates import date2num
 
 from tools.time_funcs import rm_tz
+from tools.sparkline import raster_sparkline
 
 logger = logging.getLogger("defaultLogger")
 
+# figure and axes reused by every sparkline a worker process renders
+_worker_fig = None
+
+# values of sparkline_backend in the .ini
+SPARKLINE_BACKENDS = ("matplotlib", "raster")
+
 
 def create_excel(df, path, sort=None, name=None):
+    """
+    Write df to an .xlsx with a sparkline column for each fig_dir_ column.
+
+    The workbook is write only, rows are streamed to the file as they are
+    added and the images are anchored in the same pass, so the memory used
+    doesn't grow with the number of rows.
+
+    args:
+    ---
+    df -- pandas.dataframe
+        Summarized fluxes
+    path -- str
+        Directory of the .xlsx
+    sort -- str
+        Column to sort by, not implemented
+    name -- str
+        Name of the file, the date of the first row if None
+    """
     # excel can't handle timestamps with timezones
     df = rm_tz(df)
     # initiate worksheet
-    wb = Workbook()
-    ws1 = wb.active
-    ws1.title = "Fluxes"
-    ws1 = wb.worksheets[0]
+    wb = Workbook(write_only=True)
+    ws1 = wb.create_sheet("Fluxes")
 
     # sorting by column goes here
     if sort is not None:
@@ -41,34 +66,33 @@ def create_excel(df, path, sort=None, name=None):
         xlsx_name = f"{path}/{name}.xlsx"
     logger.debug(f"Creating file {xlsx_name}.")
 
-    # dataframe rows to excel rows
-    logger.debug(f"Dataframe to excel rows")
-    for idx, r in enumerate(dataframe_to_rows(df, index=False, header=True)):
-        ws1.append(r)
-        ws1.row_dimensions[idx + 1].height = 15
-
-    # columns which are appended with "fig_dir_" have paths to figs
+    # columns which are appended with "fig_dir_" have paths to figs, each
+    # gets a column for the plot figure before the data columns
     logger.debug(f"{df.columns}")
     cols = [d for d in df.columns if "fig_dir_" in d]
-    # each column with plot paths to list
-    figs = [df[col].to_list() for col in cols]
+    figs = df[cols].to_numpy()
+    n_figs = len(cols)
+    # column and row sizes have to be set before any rows are written
+    for idxx in range(n_figs):
+        ws1.column_dimensions[get_column_letter(idxx + 1)].width = 13
+    ws1.sheet_format.defaultRowHeight = 15
+    ws1.sheet_format.customHeight = True
+    fig_letters = [get_column_letter(idxx + 1) for idxx in range(n_figs)]
 
+    # dataframe rows to excel rows
+    logger.debug(f"Dataframe to excel rows")
+    rows = dataframe_to_rows(df, index=False, header=True)
+    ws1.append([f"{col[-3:]}_graph" for col in cols] + list(next(rows)))
     logger.info(f"Adding figs to xlsx.")
-    for idxx, fig_ls in enumerate(figs):
-        # add column for each different gas
-        ws1.insert_cols(idxx + 1)
-        # adjust column width for the the plot figure
-        ws1.column_dimensions[get_column_letter(idxx + 1)].width = 13
-        # first row is the column name
-        ws1.cell(row=1, column=idxx + 1).value = f"{cols[idxx][-3:]}_graph"
-        for row, fig in enumerate(fig_ls):
-            anc_str = get_column_letter(idxx + 1) + str(row + 2)
+    for row, (r, fig_ls) in enumerate(zip(rows, figs), start=2):
+        ws1.append([None] * n_figs + list(r))
+        for letter, fig in zip(fig_letters, fig_ls):
             try:
                 img = opxl.drawing.image.Image(fig)
             except Exception:
                 logger.debug("No fig")
                 continue
-            ws1.add_image(img, anc_str)
+            ws1.add_image(img, f"{letter}{row}")
 
     path = Path(path)
     if not path.exists():
@@ -146,3 +170,82 @@ def create_rects(y, times):
         rectangle_h,
     )
     return rects
+
+
+def init_sparkline_worker():
+    """Create the figure of a sparkline worker process once"""
+    global _worker_fig
+    _worker_fig = create_fig()
+
+
+def render_sparklines(tasks, backend="matplotlib"):
+    """
+    Render a batch of sparklines, eg. every sparkline of one day, with the
+    figure of the current process.
+
+    args:
+    ---
+    tasks -- list
+        (fig_path, df, gas, rects) tuples, df has the gas column
+    backend -- str
+        "matplotlib" for create_sparkline, "raster" for raster_sparkline
+
+    returns:
+    ---
+    list
+        fig_path of the sparklines that were created
+    """
+    if backend == "matplotlib" and _worker_fig is None:
+        init_sparkline_worker()
+    done = []
+    for fig_path, df, gas, rects in tasks:
+        try:
+            if backend == "raster":
+                raster_sparkline(df, fig_path, gas, rects)
+            else:
+                fig, ax = _worker_fig
+                create_sparkline(df, fig_path, gas, fig, ax, rects)
+        except Exception as e:
+            logger.warning(f"Failed sparkline creation {fig_path}.")
+            logger.warning(e)
+            if backend == "matplotlib":
+                _worker_fig[1].cla()
+            continue
+        done.append(fig_path)
+    return done
+
+
+def render_sparkline_batches(batches, workers=1, backend="matplotlib"):
+    """
+    Render batches of sparklines, in a pool of worker processes if workers
+    is more than 1 and there's more than one batch.
+
+    args:
+    ---
+    batches -- list
+        Lists of tasks for render_sparklines
+    workers -- int
+        Number of processes
+    backend -- str
+        One of SPARKLINE_BACKENDS
+
+    returns:
+    ---
+    set
+        fig_path of every sparkline that was created
+    """
+    if backend not in SPARKLINE_BACKENDS:
+        raise Exception(
+            f"Unknown sparkline_backend {backend}, use one of {SPARKLINE_BACKENDS}."
+        )
+    render = partial(render_sparklines, backend=backend)
+    batches = [batch for batch in batches if batch]
+    workers = min(workers, len(batches))
+    if workers <= 1:
+        results = map(render, batches)
+        return set(path for done in results for path in done)
+    logger.debug(f"Rendering sparklines with {workers} processes.")
+    init = init_sparkline_worker if backend == "matplotlib" else None
+    with ProcessPoolExecutor(workers, initializer=init) as pool:
+        results = pool.map(render, batches)
+        return set(path for done in results for path in done)
@@ -1,15 +1,14 @@
 #!/usr/bin/env python3
 
 from pathlib import Path
-from re import search
-from tools.time_funcs import strftime_to_regex
-from datetime import datetime
+from tools.time_funcs import compile_timestamp_format
+import numpy as np
 import pandas as pd
 import logging
 import os
 import sys
 
-from tools.validation import overlap_test
+from tools.validation import overlap_test, INSTRUMENT_COL
 
 logger = logging.getLogger("defaultLogger")
 
@@ -106,16 +105,10 @@ def mk_date_dict(files, ts_fmt):
 
 
     """
-    file_date_dict = {
-        key: datetime.strptime(match.group(), ts_fmt)
-        for i, key in enumerate(files)
-        if (
-            match := search(
-                strftime_to_regex(ts_fmt),
-                str(key),
-            )
-        )
-    }
+    fmt = compile_timestamp_format(ts_fmt)
+    matches = [(key, text) for key in files if (text := fmt.search(str(key)))]
+    dates = fmt.parse_all([text for _, text in matches])
+    file_date_dict = {key: date for (key, _), date in zip(matches, dates)}
     return file_date_dict
 
 
@@ -145,6 +138,61 @@ def read_man_meas_f(measurement_files, chamber_cycle):
     dfs = pd.concat(tmp)
     dfs.set_index("datetime", inplace=True)
     dfs["notes"] = dfs["notes"].fillna("")
-    dfs = overlap_test(dfs)
+    dfs = overlap_test(dfs, INSTRUMENT_COL)
     dfs.sort_index(inplace=True)
     return dfs
+
+
+def combine_sorted(frames, time_col="datetime"):
+    """
+    Combines dataframes that are each in time order into one dataframe
+    indexed and sorted by time_col, without sorting all of the rows again.
+
+    Frames that don't overlap are put in order and appended. If some of
+    them overlap, the rows are merged with a stable argsort, which merges
+    the already sorted runs of each frame (k-way merge). Rows with a
+    timestamp that an earlier frame already has are dropped in the same
+    pass, eg. the same data in two overlapping files. Duplicate timestamps
+    within one frame are kept.
+
+    Parameters
+    ----------
+    frames : list
+        List of pd.DataFrame with a datetime column time_col
+
+    time_col : str
+        Column that becomes the index
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    frames = list(frames)
+    for i, df in enumerate(frames):
+        if not df[time_col].is_monotonic_increasing:
+            logger.debug(f"Frame {i} is not in time order, sorting it.")
+            frames[i] = df.sort_values(time_col, kind="stable")
+    # empty frames don't affect the order
+    filled = [df for df in frames if not df.empty]
+    if not filled:
+        return pd.concat(frames).set_index(time_col)
+    filled.sort(key=lambda df: df[time_col].iloc[0])
+    overlapping = any(
+        prev[time_col].iloc[-1] >= df[time_col].iloc[0]
+        for prev, df in zip(filled[:-1], filled[1:])
+    )
+
+    dfs = pd.concat(filled)
+    if overlapping:
+        logger.debug("Measurement files overlap, merging them.")
+        t = dfs[time_col].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        source = np.repeat(np.arange(len(filled)), [len(df) for df in filled])
+        order = np.argsort(t, kind="stable")
+        t = t[order]
+        source = source[order]
+        keep = np.ones(len(t), dtype=bool)
+        keep[1:] = (t[1:] != t[:-1]) | (source[1:] == source[:-1])
+        if not keep.all():
+            logger.info(f"Dropped {(~keep).sum()} rows that were in several files.")
+        dfs = dfs.iloc[order[keep]]
+    return dfs.set_index(time_col)
@@ -1,22 +1,20 @@
 #!/usr/bin/env python3
 
+import numpy as np
 import pandas as pd
 import logging
 from collections import namedtuple
-from tools.measurement import measurement
+from tools.measurement import measurementTable
 
 logger = logging.getLogger("defaultLogger")
 
 
 def mk_fltr_tuples(df, st="start_time", ct="close_time", ot="open_time", et="end_time"):
-    """create filter tuple from given column names"""
-    filter_tuple = base_tuple()
-    # create a list of tuples out of pandas dataframe rows
-    tuple_init = list(zip(df[st], df[ct], df[ot], df[et], df["chamber"]))
-    # unpack each  endnamedtuple
-    init_tuples = [filter_tuple(*t) for t in tuple_init]
-    filter_tuples = [measurement(t) for t in init_tuples]
-    return filter_tuples
+    """
+    Create a measurementTable from given column names, iterating it gives
+    views that behave like measurement objects
+    """
+    return measurementTable.from_df(df, st, ct, ot, et)
 
 
 def base_tuple():
@@ -74,6 +72,91 @@ def date_filter(data_to_filter, filter_tuple, s_key="start", e_key="end"):
     return df
 
 
+class segmentOffsets:
+    """
+    Row offsets of every measurement in a gas dataframe, resolved for all
+    window types at once so that the stages don't have to call date_filter
+    for each measurement.
+
+    Rows offsets["plot"][0][i]:offsets["plot"][1][i] of the dataframe are
+    the same rows that date_filter(df, measurements[i], "plot_start",
+    "plot_end") returns.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Gas data with a datetimeindex, sorted in place if it isn't already,
+        like date_filter does
+
+    measurements : measurementTable
+    """
+
+    # window name: (start key, end key) in the measurementTable, only the
+    # windows the stages read are resolved
+    windows = {
+        "measurement": ("start", "end"),
+        "plot": ("plot_start", "plot_end"),
+    }
+
+    def __init__(self, df, measurements):
+        if not df.index.is_monotonic_increasing:
+            df.sort_index(inplace=True)
+        self.index = df.index
+        self.offsets = {
+            name: measurements.locate(df.index, s_key, e_key)
+            for name, (s_key, e_key) in self.windows.items()
+        }
+
+    def fits(self, df):
+        """Check if the offsets can be used with df, it needs the same index"""
+        return df.index is self.index or df.index.equals(self.index)
+
+    def bounds(self, i, window="measurement"):
+        starts, ends = self.offsets[window]
+        return starts[i], ends[i]
+
+    def lengths(self, window="measurement"):
+        """Number of rows in each window"""
+        starts, ends = self.offsets[window]
+        return ends - starts
+
+    def first_rows(self, window="measurement"):
+        """
+        Offset of the first row of every window that has data
+
+        returns:
+        ---
+        positions -- np.array
+            Row offsets in the dataframe, for df.take
+        rows -- np.array
+            Positions of the measurements in the measurementTable
+        """
+        starts, ends = self.offsets[window]
+        rows = np.flatnonzero(ends > starts)
+        return starts[rows], rows
+
+    def slice(self, df, i, window="measurement"):
+        """
+        Rows of measurement i, equivalent to date_filter.
+
+        args:
+        ---
+        df -- pandas.dataframe
+            The dataframe the offsets were resolved for, or one with the
+            same rows
+        i -- int
+            Position of the measurement in the measurementTable
+        window -- str
+            "measurement" or "plot"
+
+        returns:
+        ---
+        Data that is inside the window
+        """
+        start, end = self.bounds(i, window)
+        return df.iloc[start:end]
+
+
 def subs_from_fltr_tuple(filter_tuple, percentage):
     """
     'Remove' percentage from both ends of the filter tuple, eg. shorten the
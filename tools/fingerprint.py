@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger("defaultLogger")
+
+
+def mk_fingerprints(df, id_col="chamber"):
+    """
+    Creates a content hash for each row of the summarized flux data.
+
+    Rows are keyed by the datetimeindex (start of the measurement) and the id
+    column, the hash covers every column of the row so any change in the
+    inputs or in the calculated results changes the fingerprint.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Summarized flux data, eg. fluxCalculator.ready_data
+
+    id_col : str
+        Name of the column that identifies the chamber
+
+    Returns
+    -------
+    fps : pd.DataFrame
+        Dataframe with columns datetime, id_col and fingerprint
+    """
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    fps = pd.DataFrame(
+        {
+            "datetime": df.index,
+            id_col: df[id_col].astype(str).values,
+            "fingerprint": hashes.values,
+        }
+    )
+    return fps
+
+
+def read_fingerprints(path, id_col="chamber"):
+    """
+    Reads fingerprints stored by a previous run.
+
+    Parameters
+    ----------
+    path : str
+        Path to the fingerprint .csv
+
+    id_col : str
+        Name of the column that identifies the chamber
+
+    Returns
+    -------
+    fps : pd.DataFrame or None
+        Stored fingerprints, None if there's no file yet
+    """
+    if path is None or not Path(path).is_file():
+        return None
+    fps = pd.read_csv(
+        path,
+        dtype={id_col: "str", "fingerprint": "uint64"},
+        parse_dates=["datetime"],
+    )
+    return fps
+
+
+def write_fingerprints(path, fps, old_fps=None, id_col="chamber"):
+    """
+    Writes fingerprints to disk, fingerprints of rows that were not in this
+    run are kept from the old fingerprints.
+
+    Parameters
+    ----------
+    path : str
+        Path to the fingerprint .csv
+
+    fps : pd.DataFrame
+        Fingerprints of the current run
+
+    old_fps : pd.DataFrame
+        Fingerprints read at the start of the run
+
+    id_col : str
+        Name of the column that identifies the chamber
+    """
+    if old_fps is not None:
+        fps = pd.concat([old_fps, fps])
+        fps = fps.drop_duplicates(subset=["datetime", id_col], keep="last")
+    fps = fps.sort_values("datetime")
+    fps.to_csv(path, index=False)
+
+
+def filter_changed(df, old_fps, id_col="chamber"):
+    """
+    Drops rows which have the same fingerprint as in the previous run.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Summarized flux data
+
+    old_fps : pd.DataFrame
+        Fingerprints from the previous run, if None all rows are returned
+
+    id_col : str
+        Name of the column that identifies the chamber
+
+    Returns
+    -------
+    changed : pd.DataFrame
+        New or changed rows of df
+
+    fps : pd.DataFrame
+        Fingerprints of all rows in df
+    """
+    fps = mk_fingerprints(df, id_col)
+    if old_fps is None or old_fps.empty:
+        return df, fps
+    merged = fps.merge(
+        old_fps,
+        on=["datetime", id_col],
+        how="left",
+        suffixes=("", "_old"),
+    )
+    mask = (merged["fingerprint"] != merged["fingerprint_old"]).values
+    changed = df[mask]
+    logger.info(f"{len(changed)} of {len(df)} rows are new or changed.")
+    return changed, fps
+
+
+def as_csv_strings(df):
+    """df as the strings to_csv writes for it, index included"""
+    text = io.StringIO(df.to_csv())
+    return pd.read_csv(text, index_col=0, dtype=str, keep_default_na=False)
+
+
+def write_changed_csv(df, path, fp_path, id_col="chamber"):
+    """
+    Updates the output .csv with only the rows that are new or changed.
+
+    If there are no stored fingerprints the whole .csv is written. Rows with
+    a datetime and id that aren't in the .csv yet and that come after its
+    last row are appended, so a run that only adds measurements writes only
+    those rows. The .csv is rewritten only if rows it already has changed,
+    the changed rows replace the rows with the same datetime and id and the
+    rows of earlier runs are kept as they were written. The .csv has one row
+    for each datetime and id, sorted by datetime.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Summarized flux data
+
+    path : str
+        Path to the output .csv
+
+    fp_path : str
+        Path to the fingerprint .csv
+
+    id_col : str
+        Name of the column that identifies the chamber
+    """
+    old_fps = None
+    if Path(path).is_file():
+        # updating only works if the columns are the same as in the old file
+        old_cols = pd.read_csv(path, nrows=0, index_col=0).columns.tolist()
+        if old_cols == df.columns.tolist():
+            old_fps = read_fingerprints(fp_path, id_col)
+    changed, fps = filter_changed(df, old_fps, id_col)
+    if old_fps is None:
+        df.to_csv(path)
+        write_fingerprints(fp_path, fps, old_fps, id_col)
+        return
+    if changed.empty:
+        return
+    old_keys = pd.MultiIndex.from_arrays([old_fps["datetime"], old_fps[id_col]])
+    keys = pd.MultiIndex.from_arrays([changed.index, changed[id_col].astype(str)])
+    after_end = changed.index.min() > old_fps["datetime"].max()
+    if after_end and not keys.isin(old_keys).any():
+        # only new rows after the end of the file
+        changed = changed.sort_index(kind="stable")
+        changed.to_csv(path, mode="a", header=False)
+        is_new = fps.set_index(["datetime", id_col]).index.isin(keys)
+        fps[is_new].sort_values("datetime").to_csv(
+            fp_path, mode="a", header=False, index=False
+        )
+        return
+    # old rows are kept as strings so they are written back unchanged
+    old = pd.read_csv(path, index_col=0, dtype=str, keep_default_na=False)
+    new = as_csv_strings(changed)
+    old_keys = pd.MultiIndex.from_arrays([old.index, old[id_col]])
+    new_keys = pd.MultiIndex.from_arrays([new.index, new[id_col]])
+    out = pd.concat([old[~old_keys.isin(new_keys)], new])
+    out = out.sort_index(kind="stable")
+    tmp = f"{path}.tmp"
+    out.to_csv(tmp)
+    os.replace(tmp, path)
+    write_fingerprints(fp_path, fps, old_fps, id_col)
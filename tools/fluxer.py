@@ -5,17 +5,17 @@ import logging
 import datetime
 import numpy as np
 import pandas as pd
+from pandas.api.extensions import take
 from pathlib import Path
 from traceback import format_exc
 from re import search
 
 # modules from this repo
 from tools.filter import (
-    date_filter,
+    segmentOffsets,
     mk_fltr_tuples,
     add_min_to_cycle,
     add_min_to_calc,
-    get_datetime_index,
 )
 from tools.file_tools import (
     get_newest,
@@ -24,6 +24,7 @@ from tools.file_tools import (
     filter_between_dates,
     read_man_meas_f,
     get_files,
+    combine_sorted,
 )
 from tools.time_funcs import (
     time_to_numeric,
@@ -42,24 +43,41 @@ from tools.gas_funcs import (
     calculate_pearsons_r,
     calculate_slope,
 )
+from tools.measurement import (
+    measurementView,
+    measurementResults,
+    gas_arrays,
+)
 from tools.merging import (
-    merge_by_dtx,
-    merge_by_id,
-    merge_by_dtx_and_id,
+    merge_aux_cfgs,
+    aggregate_by_window,
+    join_measurement_table,
 )
 
+from tools.sparkline_cache import sparklineCache
 from tools.create_excel import (
     create_excel,
-    create_sparkline,
-    create_fig,
     create_rects,
+    render_sparkline_batches,
 )
 
 from tools.parse_ini import iniHandler
 
 from tools.aux_cfg_parser import parse_aux_cfg
+from tools.compact import (
+    compact_gas_frame,
+    add_calendar_cols,
+    restore_dtypes,
+    memory_per_million_rows,
+)
+from tools.chamber_cycle import read_cycle_template, mk_cycle_calendar
 from tools.aux_data_reader import read_aux_data
-from tools.validation import check_valid, overlap_test, use_defaults
+from tools.validation import (
+    check_valid,
+    overlap_test,
+    use_defaults,
+    INSTRUMENT_COL,
+)
 
 from tools.instruments import li7810
 
@@ -81,6 +99,11 @@ class fluxCalculator:
         self.data_ext = self.ini_handler.data_ext
         self.mode = self.ini_handler.mode
         self.aux_cfgs = self.ini_handler.aux_cfgs
+        self.compact_dtypes = self.ini_handler.compact_dtypes
+        # gas columns stored as float32: decimals to restore them with
+        self.float32_cols = {}
+        # integer columns that were downcast: their original dtype
+        self.int_cols = {}
         self.init_meas_reader(self.instrument_class, self.measurement_class)
 
         # start_ts and end_ts define the timeframe from which data will be
@@ -95,10 +118,19 @@ class fluxCalculator:
         self.aux_cfgs = read_aux_data(self.aux_cfgs, self.start_ts, self.end_ts)
         self.merge_aux()
         self.merged = check_valid(
-            self.merged, self.measurement_list, self.device, self.ini_handler.meas_et
+            self.merged,
+            self.measurement_list,
+            self.device,
+            self.ini_handler.meas_et,
+            self.aux_stats[self.aux_means],
+            self.meas_table,
+            self.segments,
         )
 
-        self.merged = self.calc_slope_pearsR(self.merged)
+        # check_valid keeps only the rows of the measurements, their offsets
+        # are resolved once for the flux calculation and summarize
+        self.valid_segments = segmentOffsets(self.merged, self.measurement_list)
+        self.results = self.calc_slope_pearsR(self.merged, self.valid_segments)
         # BUG: datetime is now the chamber close time instead of the measurement
         # start time since what self.merged gets filtered down to.
         self.ready_data = self.summarize()
@@ -234,45 +266,30 @@ class fluxCalculator:
                     self.end_ts,
                 )
                 self.time_data["chamber"] = self.time_data["chamber"].astype(int)
+                # the db can have the schedules of several instruments
+                self.time_data = overlap_test(self.time_data, INSTRUMENT_COL)
             # measurement times dataframe
             self.w_merged = self.data
             self.measurement_list = mk_fltr_tuples(self.time_data)
             self.merged = self.merge_main_and_time()
 
     def mk_cham_cycle2(self):
-        tmp = []
-        # loop through files, read them into a pandas dataframe and
-        # create timestamps
-        dates = [str(date) for date in pd.unique(self.data.index.date)]
-        df = pd.read_csv(
-            self.ini_handler.get("defaults", "chamber_cycle_file"),
-            names=["time", "chamber"],
+        """
+        Chamber cycles for each date in the gas data, built from the
+        chamber_cycle_file which is parsed only once
+        """
+        dates = pd.unique(self.data.index.date)
+        template = read_cycle_template(
+            self.ini_handler.get("defaults", "chamber_cycle_file")
         )
-        for date in dates:
-            dfa = df.copy()
-            dfa["date"] = date
-            # dfa["datetime"] = pd.to_datetime(
-            #     dfa["date"] + " " + dfa["time"].astype(str)
-            # ).tz_localize("UTC")
-            dfa["datetime"] = pd.to_datetime(
-                dfa["date"] + " " + dfa["time"].astype(str)
-            )
-            # dfa["datetime"] = dfa["datetime"].dt.tz_localize("UTC")
-            # dfa["datetime"] = dfa["datetime"].tz_convert(self.data.index.tz)
-            dfa["start_time"] = dfa["datetime"]
-            dfa["close_time"] = dfa["datetime"] + pd.to_timedelta(
-                self.ini_handler.ch_ct, unit="s"
-            )
-            dfa["open_time"] = dfa["datetime"] + pd.to_timedelta(
-                self.ini_handler.ch_ot, unit="s"
-            )
-            dfa["end_time"] = dfa["datetime"] + pd.to_timedelta(
-                self.ini_handler.meas_et, unit="s"
-            )
-            tmp.append(dfa)
-
-        dfs = pd.concat(tmp)
-        dfs = overlap_test(dfs)
+        dfs = mk_cycle_calendar(
+            template,
+            dates,
+            self.ini_handler.ch_ct,
+            self.ini_handler.ch_ot,
+            self.ini_handler.meas_et,
+        )
+        dfs = overlap_test(dfs, INSTRUMENT_COL)
         dfs.set_index("datetime", inplace=True)
         return dfs
 
@@ -408,8 +425,9 @@ class fluxCalculator:
             logger.info(f"read success: {f.name}")
             df["gas_file"] = str(f.name)
             tmp.append(df)
-        # concatenate all stored dataframes into one big one
-        dfs = pd.concat(tmp)
+        # combine the files into one big dataframe in time order, the files
+        # are already sorted so only overlapping files need merging
+        dfs = combine_sorted(tmp)
         # combine individual date and time columns into datetime
         # column
         # logger.debug("Calculating ordinal times.")
@@ -418,174 +436,200 @@ class fluxCalculator:
         # )
         # dfs["numeric_time"] = numeric_timer(dfs[self.device.time_col].values)
         # dfs["numeric_datetime"] = dfs["numeric_time"] + dfs["numeric_date"]
-        dfs.set_index("datetime", inplace=True)
-        dfs.sort_index(inplace=True)
-        dfs["month"] = dfs.index.month
-        dfs["day"] = dfs.index.day
-        dfs["doy"] = dfs.index.dayofyear
+        if not self.compact_dtypes:
+            # compact dataframes get these when summarizing
+            add_calendar_cols(dfs)
         dfs["checks"] = ""
         dfs["is_valid"] = True
+        if self.compact_dtypes:
+            self.float32_cols, self.int_cols = compact_gas_frame(
+                dfs,
+                self.device.gas_cols,
+                getattr(self.device, "gas_decimals", None),
+                self.device.diag_col,
+            )
+            mb = memory_per_million_rows(dfs)
+            logger.debug(f"Gas data uses {mb:.0f} MB per million rows.")
 
         return dfs
 
     def merge_main_and_time(self):
         """
-        Merges the measurement files into the main gas measurement dataframe row
-        by row
+        Tags each gas measurement row with the position of its measurement in
+        measurement_list. The measurement times and the other per measurement
+        columns are kept once per measurement in self.meas_table and joined
+        to the rows when summarizing.
+
+        The row offsets of every measurement window in the gas data are
+        resolved here once and kept in self.segments for the later stages.
         """
-        logger.debug("Attaching measurement times to gas measurement.")
-        df = self.data.copy()
+        logger.debug("Attaching measurement ids to gas measurement.")
+        self.segments = segmentOffsets(self.data, self.measurement_list)
+        df = self.data.copy(deep=False)
         self.time_data.dropna(inplace=True, axis=1)
-        time_df = self.time_data.copy()
-        for msrmnt in self.measurement_list:
-            st, et = get_datetime_index(df, msrmnt)
-            stt, ett = get_datetime_index(time_df, msrmnt)
-            times = time_df.iloc[stt:ett]
-            for idx, row in times.iterrows():
-                for col, value in row.items():
-                    if col not in df.columns:
-                        df[col] = pd.NA
-                    df.iloc[st:et, df.columns.get_loc(col)] = value
+        self.meas_table = self.time_data.reset_index(drop=True)
+        ids = np.full(len(df), -1, dtype=np.int32)
+        starts, ends = self.segments.offsets["measurement"]
+        for i, (st, et) in enumerate(zip(starts, ends)):
+            ids[st:et] = i
+        df["measurement_id"] = ids
         return df
 
     def merge_aux(self):
+        # statistics of aux data aggregated for each measurement, one row per
+        # item in measurement_list
+        self.aux_stats = pd.DataFrame(index=range(len(self.measurement_list)))
+        self.aux_means = []
+        row_cfgs = []
         for cfg in self.aux_cfgs:
             merge_met = cfg.get("merge_method")
             name = cfg.get("name")
-            logger.info(f"merging {name} with method {merge_met}")
-            msg = f"Merged {name} with method {merge_met}"
-
-            if merge_met == "timeid":
-                merged = merge_by_dtx_and_id(self.merged, cfg)
-                if merged is not None:
-                    self.merged = merged
-                    logger.debug(msg)
-
-            if merge_met == "id":
-                merged = merge_by_id(self.merged, cfg)
-                if merged is not None:
-                    self.merged = merged
-                    logger.debug(msg)
-
-            if merge_met == "time":
-                merged = merge_by_dtx(self.merged, cfg)
-                if merged is not None:
-                    self.merged = merged
-                    logger.debug(msg)
-
-        # if there's no aux cfgs, return original
-        if len(self.aux_cfgs) == 0:
-            self.merged = self.merged
+
+            if cfg.get("aggregate") == "1" and merge_met in ("time", "timeid"):
+                logger.info(f"aggregating {name} for each measurement")
+                id_col = None
+                if merge_met == "timeid":
+                    id_col = cfg.get("id_col") or "chamber"
+                stats = aggregate_by_window(cfg, self.measurement_list, id_col)
+                self.aux_stats = self.aux_stats.join(stats)
+                self.aux_means += [c for c in cfg["df"].columns if c in stats]
+                continue
+
+            row_cfgs.append(cfg)
+
+        # all row by row merges are done in one pass
+        self.merged = merge_aux_cfgs(self.merged, row_cfgs, self.meas_table)
         logger.info(f"Completed merging {len(self.aux_cfgs)} auxiliary datasets.")
 
-    def calc_slope_pearsR(self, data):
+    def calc_slope_pearsR(self, data, segments=None):
         """
         Calculates Pearson's R (correlation) and the slope of the CH4 flux.
 
+        The gas data is read through measurementViews so nothing is copied,
+        results are written to a measurementResults table.
+
         Args:
         ---
         data -- pandas.DataFrame
             DataFrame of the gas flux
+        segments -- segmentOffsets
+            Offsets of the measurements in data, resolved here if None
 
         Returns:
         ---
-        all_measurements_df -- pandas.DataFrame
-            DataFrame with additional slope, Pearson's R, and flux columns
+        results -- measurementResults
+            calc_height, slope, Pearson's R and flux for each measurement in
+            self.measurement_list
         """
-        measurement_list = []
+        if segments is None or not segments.fits(data):
+            segments = segmentOffsets(data, self.measurement_list)
+        starts, ends = segments.offsets["measurement"]
+        p_starts, p_ends = segments.offsets["plot"]
+        cols = [
+            "numeric_datetime",
+            "measurement_id",
+            "air_temperature",
+            "air_pressure",
+            "snowdepth",
+            *self.device.gas_cols,
+        ]
+        arrays = gas_arrays(data, [col for col in cols if col in data.columns])
+        checks = data["checks"].array
+        ids = arrays["measurement_id"]
+        overlap = self.meas_table["overlap"].array
+        has_table_snow = "snowdepth" in self.meas_table.columns
+        if has_table_snow:
+            table_snow = self.meas_table["snowdepth"].array
+
+        # the columns that are available don't change between measurements
+        defaults = use_defaults(
+            measurementView(arrays, 0, 0, dict.fromkeys(self.aux_means)),
+            self.use_defaults,
+        )
+        columns = []
+        # snowdepth is set to 0 if it isn't available at all
+        zero_snow = not has_table_snow and "snowdepth" not in arrays
+        if zero_snow:
+            columns.append("snowdepth")
+        columns.append("calc_height")
+        if defaults:
+            columns += ["air_pressure", "air_temperature"]
+        for gas in self.device.gas_cols:
+            columns += [f"{gas}_slope", f"{gas}_pearsons_r", f"{gas}_flux"]
+        results = measurementResults(
+            len(self.measurement_list), columns, ["snowdepth"]
+        )
 
-        def append_df_with_logging(df, message, measurement):
+        def skip(message, measurement):
             logger.warning(message + f" at {measurement.start}")
-            measurement_list.append(df)
 
-        def check_conditions_and_continue(mdf, df, measurement):
-            if mdf.empty:
-                append_df_with_logging(df, "DataFrame empty", measurement)
-                return True
-            if "has errors" in mdf.iloc[0]["checks"]:
-                append_df_with_logging(
-                    df, "Skipping flux calculation due to diagnostic flags", measurement
-                )
-                return True
-            if df["overlap"].any():
-                append_df_with_logging(
-                    df, "Overlapping measurement, skipping", measurement
-                )
-                return True
-            return False
+        mm_to_m = 1000
+        cm_to_m = 100
+        cham_h = round(self.ini_handler.chamber_h / mm_to_m, 2)
 
         logger.info("Starting gas flux calculations.")
-        for msrmnt in self.measurement_list:
-            df = date_filter(data, msrmnt, "plot_start", "plot_end").copy()
-            mdf = date_filter(df, msrmnt).copy()
+        for i, msrmnt in enumerate(self.measurement_list):
+            constants = {col: self.aux_stats[col].iat[i] for col in self.aux_means}
+            mdf = measurementView(
+                arrays, starts[i], ends[i], constants, self.float32_cols
+            )
 
             logger.info(f"Calculating flux from {msrmnt.close} to {msrmnt.open}")
 
-            # Skip iteration if conditions are met
-            if check_conditions_and_continue(mdf, df, msrmnt):
+            if mdf.empty:
+                skip("DataFrame empty", msrmnt)
+                continue
+            if "has errors" in checks[starts[i]]:
+                skip("Skipping flux calculation due to diagnostic flags", msrmnt)
+                continue
+            plot_ids = ids[p_starts[i] : p_ends[i]]
+            if take(overlap, plot_ids, allow_fill=True).any():
+                skip("Overlapping measurement, skipping", msrmnt)
                 continue
 
-            # Ensure snowdepth column exists
-            df["snowdepth"] = df.get("snowdepth", 0)
-            mdf["snowdepth"] = mdf.get("snowdepth", 0)
-
-            # Calculate height
-            mm_to_m = 1000
-            cm_to_m = 100
-            cham_h = round(self.ini_handler.chamber_h / mm_to_m, 2)
-            snow_h = round(df.iloc[1]["snowdepth"] / cm_to_m, 2)
+            # snowdepth from the measurement table replaces aggregated
+            # snowdepth, like it is joined when summarizing
+            if has_table_snow:
+                mdf.constants["snowdepth"] = table_snow[ids[starts[i]]]
+            if "snowdepth" in self.aux_means:
+                snow = mdf.constants["snowdepth"]
+            elif has_table_snow:
+                snow = take(table_snow, plot_ids[1:2], allow_fill=True)[0]
+            elif zero_snow:
+                snow = 0
+            else:
+                snow = arrays["snowdepth"][p_starts[i] : p_ends[i]][1]
+            snow_h = round(snow / cm_to_m, 2)
             height = round(cham_h - snow_h, 2)
-            df["calc_height"] = height
+
+            values = {"calc_height": height}
+            if zero_snow:
+                values["snowdepth"] = 0
+            if defaults:
+                # NOTE: figure out a better way of using default temp and
+                # pressure
+                mdf.constants["air_pressure"] = self.ini_handler.def_press
+                mdf.constants["air_temperature"] = self.ini_handler.def_temp
+                values["air_pressure"] = self.ini_handler.def_press
+                values["air_temperature"] = self.ini_handler.def_temp
 
             # Process each gas
             for gas in self.device.gas_cols:
                 slope, pearsons, flux = self.calculate_gas_properties(
-                    mdf, df, gas, height
+                    mdf, gas, height
                 )
-                df[f"{gas}_slope"] = slope
-                df[f"{gas}_pearsons_r"] = pearsons
-                df[f"{gas}_flux"] = flux
-
-                if use_defaults(df, self.use_defaults):
-                    # NOTE: figure out a better way of using default temp and
-                    # pressure
-                    df["air_pressure"] = self.ini_handler.def_press
-                    df["air_temperature"] = self.ini_handler.def_temp
-                    mdf["air_pressure"] = self.ini_handler.def_press
-                    mdf["air_temperature"] = self.ini_handler.def_temp
-                    flux = calculate_gas_flux(
-                        mdf,
-                        gas,
-                        slope,
-                        height,
-                    )
-                else:
-                    flux = calculate_gas_flux(
-                        mdf,
-                        gas,
-                        slope,
-                        height,
-                    )
-                    df[f"{gas}_flux"] = flux
-
-            measurement_list.append(df)
-        all_measurements_df = pd.concat(measurement_list)
-        return all_measurements_df
+                values[f"{gas}_slope"] = slope
+                values[f"{gas}_pearsons_r"] = pearsons
+                values[f"{gas}_flux"] = flux
+            results.set(i, **values)
+        return results
 
-    def calculate_gas_properties(self, mdf, df, gas, height):
+    def calculate_gas_properties(self, mdf, gas, height):
         """
         Helper function to calculate slope, Pearson's R, and flux for a specific gas.
         """
         slope = calculate_slope(mdf["numeric_datetime"], mdf[gas])
         pearsons = calculate_pearsons_r(mdf["numeric_datetime"], mdf[gas])
-
-        # Use default temperature and pressure if necessary
-        if use_defaults(df, self.use_defaults):
-            df["air_pressure"] = self.ini_handler.def_press
-            df["air_temperature"] = self.ini_handler.def_temp
-            mdf["air_pressure"] = self.ini_handler.def_press
-            mdf["air_temperature"] = self.ini_handler.def_temp
-
         flux = calculate_gas_flux(mdf, gas, slope, height)
         return slope, pearsons, flux
 
@@ -603,7 +647,6 @@ class fluxCalculator:
 
 
         """
-        dfList = []
         measurement_cols = self.device.usecols
         drop_cols = [
             # "numeric_date",
@@ -615,10 +658,25 @@ class fluxCalculator:
             + drop_cols
             + [col for col in self.merged.columns if "idx_cp" in col]
         )
-        for msrmnt in self.measurement_list:
-            dfa = date_filter(self.merged, msrmnt)
-            dfList.append(dfa.iloc[:1])
-        summary = pd.concat(dfList)
+        # first row of each measurement that has gas data, taken at once
+        segments = self.valid_segments
+        if not segments.fits(self.merged):
+            segments = segmentOffsets(self.merged, self.measurement_list)
+        positions, rows = segments.first_rows()
+        summary = self.merged.take(positions)
+        summary = restore_dtypes(summary, self.float32_cols, self.int_cols)
+        if "month" not in summary.columns:
+            add_calendar_cols(summary, summary.columns.get_loc("checks"))
+        summary = self.results.add_to(summary, rows)
+        summary = join_measurement_table(summary, self.meas_table)
+        # join the aggregated aux data, values that were replaced with
+        # defaults in the flux calculation are kept
+        stats = self.aux_stats.iloc[rows].set_index(summary.index)
+        for col in stats.columns:
+            if col in summary.columns:
+                summary[col] = summary[col].fillna(stats[col])
+            else:
+                summary[col] = stats[col]
         if "test" not in self.ini_handler.ini_name:
             summary.drop(labels=drop_cols, axis=1, inplace=True)
         # convert True/False to 1/0
@@ -633,51 +691,80 @@ class fluxCalculator:
                 path.mkdir(parents=True)
             return path
 
-        # create a list of days for creating outputs
-        daylist = []
-        # initiate sparkline
-        fig, ax = create_fig()
+        # days of the run, for finding orphaned sparklines
+        days = set()
         times = self.measurement_list.copy()
+        workers = self.ini_handler.sparkline_workers
+        backend = self.ini_handler.sparkline_backend
+        # seconds it takes to render one sparkline
+        per_plot = 0.002 if backend == "raster" else 0.05
 
         gases = self.device.gas_cols
         logger.info(f"Creating {len(times) * len(gases)} sparklines.")
         logger.info(
-            f"Time estimate: {convert_seconds(len(times) * (0.05 * len(gases)))}."
+            "Time estimate: "
+            f"{convert_seconds(len(times) * (per_plot * len(gases)) / workers)}."
         )
-        for msrmnt in self.measurement_list:
-            data = date_filter(self.w_merged, msrmnt, "plot_start", "plot_end").copy()
+        # w_merged is the gas data the offsets were resolved for
+        segments = self.segments
+        if not segments.fits(self.w_merged):
+            segments = segmentOffsets(self.w_merged, self.measurement_list)
+        fig_root = self.ini_handler.fig_path
+        # sparklines that are already up to date are not rendered again
+        cache = sparklineCache(backend)
+        # the sparklines of each day are rendered as one batch
+        batches = {}
+        # gas: {measurement start: fig path}
+        fig_paths = {gas: {} for gas in gases}
+        for i, msrmnt in enumerate(self.measurement_list):
+            data = segments.slice(self.w_merged, i, "plot")
             day = msrmnt.date
+            days.add(day)
             if data.empty:
-                daylist.append(day)
                 continue
-            smask = self.ready_data.index == msrmnt.start
-            daylist.append(day)
-            try:
-                day = msrmnt.date
-                name = msrmnt.start.strftime("%Y%m%d%H%M%S")
-                for gas in gases:
-                    fig_root = "figs"
-                    plotname = f"{name}.png"
-                    path = create_path(fig_root, gas, day)
-                    fig_path = str(path / plotname)
-                    self.ready_data.loc[smask, f"fig_dir_{gas}"] = fig_path
-                    y = data[gas]
-                    rects = create_rects(y, msrmnt)
-                    create_sparkline(data[[gas]], fig_path, gas, fig, ax, rects)
-            except Exception as e:
-                logger.warning("Failed sparkline creation.")
-                logger.warning(e)
-        # converting list to dict and then to list again removes duplicate items
-        daylist = list(dict.fromkeys(daylist))
-        sort = None
-        for day in daylist:
-            data = self.ready_data[self.ready_data.index.date == day]
-            if data.empty:
+            batch = batches.setdefault(day, [])
+            name = msrmnt.start.strftime(cache.name_fmt)
+            for gas in gases:
+                path = create_path(fig_root, gas, day)
+                fig_path = str(path / f"{name}.png")
+                try:
+                    rects = create_rects(data[gas], msrmnt)
+                except Exception as e:
+                    logger.warning("Failed sparkline creation.")
+                    logger.warning(e)
+                    continue
+                fig_paths[gas][msrmnt.start] = fig_path
+                plot = data[[gas]]
+                if not cache.check(fig_path, plot, gas, rects):
+                    batch.append((fig_path, plot, gas, rects))
+        logger.info(f"{len(cache.current)} sparklines are up to date.")
+        done = render_sparkline_batches(list(batches.values()), workers, backend)
+        done = cache.update(done)
+        # pngs of this run's time span that no measurement uses anymore
+        if len(times):
+            starts = times.times("start")
+            fig_dirs = [f"{fig_root}/{gas}/{day}" for day in days for gas in gases]
+            expected = {p for paths in fig_paths.values() for p in paths.values()}
+            cache.remove_orphans(fig_dirs, starts.min(), starts.max(), expected)
+        cache.save()
+        # paths are added once every sparkline is done so the columns don't
+        # depend on the order the workers finish in
+        for gas in gases:
+            if not fig_paths[gas]:
                 continue
+            paths = {st: path for st, path in fig_paths[gas].items() if path in done}
+            self.ready_data[f"fig_dir_{gas}"] = self.ready_data.index.map(paths)
+        sort = None
+        excel_path = self.ini_handler.excel_path
+        # one file per day and the whole run in one file per month, each file
+        # is written and released before the next one
+        for day, data in self.ready_data.groupby(self.ready_data.index.date):
             logger.debug(f"Columns in data passed to create_excel: {data.columns}")
             logger.debug(f"{data.head()}")
-            create_excel(data, self.ini_handler.excel_path, sort)
-        create_excel(self.ready_data, self.ini_handler.excel_path, sort, "all_data")
+            create_excel(data, excel_path, sort)
+        months = self.ready_data.index.strftime("%Y%m")
+        for month, data in self.ready_data.groupby(months):
+            create_excel(data, excel_path, sort, f"all_data_{month}")
         logger.info(f"Saved output .xlsx in {self.ini_handler.excel_path}")
 
 
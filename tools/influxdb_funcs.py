@@ -5,11 +5,33 @@ from influxdb_client.client.write_api import SYNCHRONOUS
 import logging
 from urllib3.exceptions import NewConnectionError
 import datetime
-from tools.time_funcs import time_to_numeric, get_time_diff, convert_timestamp_format
+from tools.time_funcs import (
+    get_time_diff,
+    datetime_to_epoch,
+    datetime_to_ordinal,
+    datetime_to_numeric,
+    datetime_to_strings,
+)
+from tools.query_cache import init_cache
+import timeit
+import numpy as np
 import pandas as pd
+from influxdb_client import Dialect
+from tools.fingerprint import (
+    filter_changed,
+    read_fingerprints,
+    write_fingerprints,
+)
 
 logger = logging.getLogger("defaultLogger")
 
+# only the datatype annotation is needed for decoding the columns
+CSV_DIALECT = Dialect(
+    header=True,
+    annotations=["datatype"],
+    date_time_format="RFC3339Nano",
+)
+
 
 def init_client(ifdb_dict):
     url = ifdb_dict.get("url")
@@ -80,6 +102,159 @@ def mk_ifdb_ts(ts):
     return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
+def to_typed_array(values, datatype):
+    """
+    Converts a list of strings from the annotated csv into a numpy array
+    with the dtype given in the #datatype annotation.
+    """
+    if datatype.startswith("dateTime"):
+        # RFC3339 strings straight to int64 nanoseconds since epoch
+        ts = pd.to_datetime(values, format="ISO8601", utc=True)
+        return ts.tz_convert(None).as_unit("ns").values
+    arr = np.asarray(values, dtype=object)
+    empty = arr == ""
+    if datatype == "double" or (datatype in ("long", "unsignedLong") and empty.any()):
+        arr[empty] = "nan"
+        return arr.astype(np.float64)
+    if datatype == "long":
+        return arr.astype(np.int64)
+    if datatype == "unsignedLong":
+        return arr.astype(np.uint64)
+    if datatype == "boolean":
+        return arr == "true"
+    return arr
+
+
+def decode_annotated_csv(rows, fields, time_col="_time"):
+    """
+    Decodes rows of an annotated influxdb csv response into typed columns.
+
+    args:
+    ---
+    rows -- iterable
+        csv rows as lists of strings, eg. from query_api().query_csv()
+    fields -- list
+        names of the fields to keep
+
+    returns:
+    ---
+    df -- pandas.dataframe
+        datetime column and one column for each field, None if there's no
+        rows
+    """
+    start = timeit.default_timer()
+    names = [time_col] + fields
+    cols = {name: [] for name in names}
+    types = {name: "string" for name in names}
+    types[time_col] = "dateTime:RFC3339"
+    datatypes = None
+    header = None
+    for row in rows:
+        # empty row separates tables, each table has its own annotations
+        # and header
+        if not row or row == [""]:
+            header = None
+            datatypes = None
+            continue
+        if row[0] == "#datatype":
+            datatypes = row
+            continue
+        if row[0].startswith("#"):
+            continue
+        if header is None:
+            header = [(cols[n], row.index(n)) for n in names if n in row]
+            missing = [cols[n] for n in names if n not in row]
+            if datatypes is not None:
+                types.update({n: datatypes[row.index(n)] for n in names if n in row})
+            continue
+        for col, pos in header:
+            col.append(row[pos])
+        for col in missing:
+            col.append("")
+
+    n_rows = len(cols[time_col])
+    if n_rows == 0:
+        return None
+    df = pd.DataFrame({name: to_typed_array(cols[name], types[name]) for name in names})
+    df = df.rename(columns={time_col: "datetime"})
+    elapsed = timeit.default_timer() - start
+    logger.info(
+        f"Decoded {n_rows} rows in {elapsed:.3f} s, {n_rows / elapsed:.0f} rows/s."
+    )
+    return df
+
+
+def query_ifdb(
+    ifdb_dict, bucket, measurement, fields, start, stop, raise_errors=False
+):
+    """
+    Runs a query for the fields of measurement between start and stop
+
+    args:
+    ---
+    start, stop -- str or int
+        range of the query in influxdb format
+    raise_errors -- bool
+        raise the error if the query fails instead of returning None, so
+        that a failed query can be told apart from a range without data
+
+    returns:
+    ---
+    df -- pandas.dataframe
+        data with a tz naive datetime column, None if there is no data or
+        the query fails
+    """
+    with init_client(ifdb_dict) as client:
+        q_api = client.query_api()
+        query = mk_query(bucket, start, stop, measurement, fields)
+        logger.debug("Query:\n" + query)
+        try:
+            rows = q_api.query_csv(query, dialect=CSV_DIALECT)
+            df = decode_annotated_csv(rows, fields)
+        except Exception:
+            if raise_errors:
+                raise
+            logger.info(f"No data with query:\n {query}")
+            return None
+
+    if df is None:
+        logger.info(f"No data with query:\n {query}")
+    return df
+
+
+def cached_query_ifdb(ifdb_dict, bucket, measurement, fields, start_ts, stop_ts):
+    """
+    Runs the query through the on disk cache if cache_dir is defined in the
+    influxDB section, otherwise queries the db directly.
+
+    args:
+    ---
+    start_ts, stop_ts -- datetime.datetime or None
+        range of the query
+    """
+    cache = init_cache(ifdb_dict)
+    if cache is None or start_ts is None:
+        start = mk_ifdb_ts(start_ts) if start_ts is not None else 0
+        stop = mk_ifdb_ts(stop_ts) if stop_ts is not None else "now()"
+        return query_ifdb(ifdb_dict, bucket, measurement, fields, start, stop)
+
+    if stop_ts is None:
+        stop_ts = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    def fetch(s, e):
+        return query_ifdb(
+            ifdb_dict,
+            bucket,
+            measurement,
+            fields,
+            mk_ifdb_ts(s),
+            mk_ifdb_ts(e),
+            raise_errors=True,
+        )
+
+    return cache.read(bucket, measurement, fields, start_ts, stop_ts, fetch)
+
+
 def read_aux_ifdb(dict, s_ts=None, e_ts=None):
     logger.debug(dict)
     # logger.debug(f"Running query from {start_ts} to {stop_ts}")
@@ -90,26 +265,17 @@ def read_aux_ifdb(dict, s_ts=None, e_ts=None):
 
     logger.debug(s_ts)
     if s_ts is not None:
-        s_ts = convert_timestamp_format(s_ts, "%Y-%m-%dT%H:%M:%SZ")
+        s_ts = datetime.datetime.strptime(s_ts, "%Y-%m-%d %H:%M:%S")
         logger.debug(s_ts)
     if e_ts is not None:
-        e_ts = convert_timestamp_format(e_ts, "%Y-%m-%dT%H:%M:%SZ")
-
-    with init_client(dict) as client:
-        q_api = client.query_api()
-        query = mk_query(bucket, s_ts, e_ts, measurement, fields)
-        logger.debug("Query:\n" + query)
-        try:
-            df = q_api.query_data_frame(query)[["_time"] + fields]
-        except Exception:
-            logger.info(f"No data with query:\n {query}")
-            return None
+        e_ts = datetime.datetime.strptime(e_ts, "%Y-%m-%d %H:%M:%S")
 
-        df = df.rename(columns={"_time": "datetime"})
-        df["datetime"] = df.datetime.dt.tz_convert(None)
-        df.set_index("datetime", inplace=True)
-        logger.debug(f"\n{df}")
-        return df
+    df = cached_query_ifdb(dict, bucket, measurement, fields, s_ts, e_ts)
+    if df is None:
+        return None
+    df.set_index("datetime", inplace=True)
+    logger.debug(f"\n{df}")
+    return df
 
 
 def read_ifdb(ifdb_dict, meas_dict, start_ts=None, stop_ts=None):
@@ -119,31 +285,12 @@ def read_ifdb(ifdb_dict, meas_dict, start_ts=None, stop_ts=None):
     measurement = meas_dict.get("measurement")
     fields = list(meas_dict.get("fields").split(","))
 
-    if start_ts is not None:
-        start = mk_ifdb_ts(start_ts)
-    else:
-        start = 0
-
-    if stop_ts is not None:
-        stop = mk_ifdb_ts(stop_ts)
-    else:
-        stop = "now()"
-
-    with init_client(ifdb_dict) as client:
-        q_api = client.query_api()
-        query = mk_query(bucket, start, stop, measurement, fields)
-        logger.debug("Query:\n" + query)
-        try:
-            df = q_api.query_data_frame(query)[["_time"] + fields]
-        except Exception:
-            logger.info(f"No data with query:\n {query}")
-            return None
-
-        df = df.rename(columns={"_time": "datetime"})
-        df["datetime"] = df.datetime.dt.tz_convert(None)
-        df = add_cols_to_ifdb_q(df, meas_dict)
-        logger.debug(f"\n{df}")
-        return df
+    df = cached_query_ifdb(ifdb_dict, bucket, measurement, fields, start_ts, stop_ts)
+    if df is None:
+        return None
+    df = add_cols_to_ifdb_q(df, meas_dict)
+    logger.debug(f"\n{df}")
+    return df
 
 
 def add_cols_to_ifdb_q(df, meas_dict):
@@ -165,21 +312,23 @@ def add_cols_to_ifdb_q(df, meas_dict):
         df["close_time"] = df["start_time"] + pd.to_timedelta(diff, unit="s")
         # df["chamber"] = df["Plot Number"]
     # df["datetime"] = df.datetime.dt.tz_convert(None)
-    df["DATE"] = df["datetime"].dt.strftime("%Y-%m-%d")
-    df["TIME"] = df["datetime"].dt.strftime("%H:%M:%S")
+    times = df["datetime"].values
+    df["DATE"], df["TIME"] = datetime_to_strings(times)
     df["checks"] = ""
     df["is_valid"] = ""
 
     logger.info("Calculating ordinal times.")
-    df["numeric_date"] = pd.to_datetime(df["DATE"]).map(datetime.datetime.toordinal)
-    df["numeric_time"] = time_to_numeric(df["TIME"].values)
-    df["numeric_datetime"] = df["numeric_time"] + df["numeric_date"]
+    df["numeric_date"] = datetime_to_ordinal(times)
+    df["numeric_time"] = datetime_to_numeric(times)
+    # seconds since epoch, same as the SECONDS.NANOSECONDS of the instrument
+    # files
+    df["numeric_datetime"] = datetime_to_epoch(times)
     df.set_index("datetime", inplace=True)
     logger.debug(f"\n{df}")
     return df
 
 
-def ifdb_push(df, ifdb_dict, tag_columns):
+def ifdb_push(df, ifdb_dict, tag_columns=None, fp_path=None):
     """
     Push data to InfluxDB
 
@@ -187,35 +336,31 @@ def ifdb_push(df, ifdb_dict, tag_columns):
     ---
     df -- pandas dataframe
         data to be pushed into influxdb
+    ifdb_dict -- dict
+        influxDB section of the .ini
+    tag_columns -- list
+        columns used as tags
+    fp_path -- str
+        path to the fingerprints of previously pushed rows, if given only new
+        or changed rows are pushed
 
     returns:
     ---
 
     """
-    with ifdb.InfluxDBClient(
-        url=ifdb_dict.get("url"),
-        token=ifdb_dict.get("token"),
-        org=ifdb_dict.get("organization"),
-    ) as client:
-        write_api = client.write_api(write_options=SYNCHRONOUS)
-        try:
-            write_api.write(
-                bucket=ifdb_dict.get("bucket"),
-                record=df,
-                data_frame_measurement_name=ifdb_dict.get("measurement_name"),
-                data_frame_timestamp_timezone=ifdb_dict.get("timezone"),
-                data_frame_tag_columns=tag_columns,
-                debug=True,
-            )
-        except NewConnectionError:
-            logger.info(f"Couldn't connect to database at " f"{ifdb_dict.get('url')}")
-    logger.debug("Attempting push.")
-    print("Attempting push.")
     url = ifdb_dict.get("url")
     bucket = ifdb_dict.get("bucket")
     measurement_name = ifdb_dict.get("measurement_name")
     timezone = ifdb_dict.get("timezone")
 
+    if fp_path is not None:
+        old_fps = read_fingerprints(fp_path)
+        df, fps = filter_changed(df, old_fps)
+        if df.empty:
+            logger.info("No new or changed rows to push.")
+            return
+
+    logger.debug("Attempting push.")
     with init_client(ifdb_dict) as client:
         write_api = client.write_api(write_options=SYNCHRONOUS)
         try:
@@ -224,17 +369,19 @@ def ifdb_push(df, ifdb_dict, tag_columns):
                 record=df,
                 data_frame_measurement_name=measurement_name,
                 data_frame_timestamp_timezone=timezone,
-                # NOTE: figure out a good way of handling tag cols
-                # data_frame_tag_columns="ac",
+                data_frame_tag_columns=tag_columns,
                 debug=True,
             )
         except NewConnectionError:
             logger.info(f"Couldn't connect to database at {url}")
-            pass
+            return
 
         first = str(df.index[0])
         last = str(df.index[-1])
-        logging.info(f"Pushed data between {first}-{last} to DB")
+        logger.info(f"Pushed data between {first}-{last} to DB")
+    # only store fingerprints after the rows are in the db
+    if fp_path is not None:
+        write_fingerprints(fp_path, fps, old_fps)
 
 
 def check_oldest_db_ts(ifdb_dict, meas_dict, gas_cols):
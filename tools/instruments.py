@@ -2,6 +2,7 @@
 
 import pandas as pd
 from re import search
+from tools.time_funcs import epoch_from_parts, parse_date_and_time
 
 
 class li7810:
@@ -28,6 +29,8 @@ class li7810:
         self.time_fmt = "%H:%M:%S"
         self.diag_col = "DIAG"
         self.gas_cols = ["CO2", "CH4"]
+        # decimals of the gas values in the files
+        self.gas_decimals = 3
 
     def read_file(self, f):
         li_id = search(r"TG10-\d\d\d\d\d", f.name).group(0)
@@ -39,12 +42,20 @@ class li7810:
             dtype=self.dtypes,
         )
         df["li_id"] = li_id
-        df["datetime"] = pd.to_datetime(
-            df[self.date_col] + df[self.time_col],
-            format=self.date_fmt + self.time_fmt,
-            # ).dt.tz_localize("UTC")
+        datetimes = parse_date_and_time(
+            df[self.date_col].to_numpy(),
+            df[self.time_col].to_numpy(),
+            self.date_fmt,
+            self.time_fmt,
         )
-        df["numeric_datetime"] = (df[self.sec_col] + "." + df[self.nsec_col]).astype(
-            float
+        if datetimes is None:
+            datetimes = pd.to_datetime(
+                df[self.date_col] + df[self.time_col],
+                format=self.date_fmt + self.time_fmt,
+                # ).dt.tz_localize("UTC")
+            )
+        df["datetime"] = datetimes
+        df["numeric_datetime"] = epoch_from_parts(
+            df[self.sec_col].values, df[self.nsec_col].values
         )
         return df
@@ -1,5 +1,10 @@
+import numpy as np
+import pandas as pd
 from pandas import Timedelta
 
+# how much gas data is shown before and after the measurement in the plots
+PLOT_PAD = Timedelta(minutes=2).value
+
 
 class measurement:
     def __init__(self, init_data=None, instrument="LI-7810", instrument_id=None):
@@ -40,3 +45,311 @@ class measurement:
 
     def calc_flux(self):
         pass
+
+
+def to_ns(values):
+    """Datetimes as int64 nanoseconds"""
+    return np.asarray(values, dtype="datetime64[ns]").view(np.int64)
+
+
+class measurementRow:
+    """
+    View of one measurement in a measurementTable. Has the same attributes as
+    measurement so it can be used wherever measurement objects were used.
+    """
+
+    __slots__ = ("table", "i")
+
+    def __init__(self, table, i):
+        self.table = table
+        self.i = i
+
+    def timestamp(self, key):
+        return pd.Timestamp(getattr(self.table, key)[self.i])
+
+    @property
+    def id(self):
+        return self.table.id[self.i]
+
+    @property
+    def start(self):
+        return self.timestamp("start")
+
+    @property
+    def close(self):
+        return self.timestamp("close")
+
+    @property
+    def open(self):
+        return self.timestamp("open")
+
+    @property
+    def end(self):
+        return self.timestamp("end")
+
+    @property
+    def plot_start(self):
+        return self.timestamp("plot_start")
+
+    @property
+    def plot_end(self):
+        return self.timestamp("plot_end")
+
+    @property
+    def doy(self):
+        return self.start.dayofyear
+
+    @property
+    def date(self):
+        return self.start.date()
+
+    @property
+    def month(self):
+        return self.start.month
+
+    @property
+    def day(self):
+        return self.start.day
+
+    @property
+    def week(self):
+        return self.start.week
+
+    @property
+    def instrument(self):
+        return self.table.instrument
+
+    @property
+    def instrument_id(self):
+        return self.table.instrument_id
+
+    def __repr__(self):
+        return f"measurementRow({self.id}, {self.start}, {self.end})"
+
+
+class measurementTable:
+    """
+    All measurements of a run as arrays, one row per measurement.
+
+    The times are stored as int64 nanoseconds so whole columns can be compared
+    with the gas data at once. Iterating or indexing with an integer gives
+    measurementRow views.
+
+    Parameters
+    ----------
+    start, close, open, end : array like
+        Datetimes of the measurement cycle
+
+    ids : array like
+        Chamber ids
+
+    instrument : str
+
+    instrument_id : str
+    """
+
+    time_keys = ("start", "close", "open", "end", "plot_start", "plot_end")
+
+    def __init__(
+        self, start, close, open, end, ids, instrument="LI-7810", instrument_id=None
+    ):
+        self.start = to_ns(start)
+        self.close = to_ns(close)
+        self.open = to_ns(open)
+        self.end = to_ns(end)
+        self.plot_start = self.start - PLOT_PAD
+        self.plot_end = self.end + PLOT_PAD
+        self.id = np.asarray(ids)
+        self.instrument = instrument
+        self.instrument_id = instrument_id
+
+    @classmethod
+    def from_df(
+        cls, df, st="start_time", ct="close_time", ot="open_time", et="end_time"
+    ):
+        """Create the table from the columns of a measurement times dataframe"""
+        return cls(df[st], df[ct], df[ot], df[et], df["chamber"].to_numpy())
+
+    def __len__(self):
+        return len(self.start)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield measurementRow(self, i)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("measurementTable index out of range")
+            return measurementRow(self, int(key))
+        return measurementTable(
+            self.start[key],
+            self.close[key],
+            self.open[key],
+            self.end[key],
+            self.id[key],
+            self.instrument,
+            self.instrument_id,
+        )
+
+    def copy(self):
+        return self[:]
+
+    def times(self, key):
+        """Column of times as a DatetimeIndex, eg. times("close")"""
+        return pd.DatetimeIndex(getattr(self, key).view("datetime64[ns]"))
+
+    @property
+    def dates(self):
+        return self.times("start").date
+
+    @property
+    def doy(self):
+        return self.times("start").dayofyear.to_numpy()
+
+    @property
+    def month(self):
+        return self.times("start").month.to_numpy()
+
+    @property
+    def day(self):
+        return self.times("start").day.to_numpy()
+
+    def locate(self, index, s_key="start", e_key="end"):
+        """
+        Row offsets of every measurement in a sorted datetimeindex, same as
+        calling get_datetime_index for each measurement.
+
+        Parameters
+        ----------
+        index : pd.DatetimeIndex
+
+        s_key, e_key : str
+            Which times to use as the start and end of the window
+
+        Returns
+        -------
+        starts, ends : np.array
+            int64 positions, rows starts[i]:ends[i] belong to measurement i
+        """
+        times = to_ns(index)
+        starts = np.searchsorted(times, getattr(self, s_key), side="left")
+        ends = np.searchsorted(times, getattr(self, e_key), side="left")
+        return starts, ends
+
+
+class measurementView:
+    """
+    Rows start:end of the gas data without copying them. Columns are returned
+    as pd.Series that share memory with the gas data.
+
+    Parameters
+    ----------
+    arrays : dict
+        Column name: np.array of the whole gas dataframe, see gas_arrays
+
+    start, end : int
+        Row offsets of the measurement
+
+    constants : dict
+        Columns that have one value for the whole measurement, eg. aggregated
+        aux data, these take precedence over arrays
+
+    decimals : dict
+        float32 columns of compact gas data, column: decimals, these are
+        returned as the original float64 values
+    """
+
+    __slots__ = ("arrays", "start", "end", "constants", "decimals")
+
+    def __init__(self, arrays, start, end, constants=None, decimals=None):
+        self.arrays = arrays
+        self.start = start
+        self.end = end
+        self.constants = constants or {}
+        self.decimals = decimals or {}
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def empty(self):
+        return self.end <= self.start
+
+    @property
+    def columns(self):
+        return list(self.arrays) + [c for c in self.constants if c not in self.arrays]
+
+    def __contains__(self, col):
+        return col in self.constants or col in self.arrays
+
+    def __getitem__(self, col):
+        if col in self.constants:
+            return pd.Series(np.full(len(self), self.constants[col]))
+        values = self.arrays[col][self.start : self.end]
+        if col in self.decimals:
+            return pd.Series(np.round(values.astype(np.float64), self.decimals[col]))
+        return pd.Series(values, copy=False)
+
+
+def gas_arrays(df, cols=None):
+    """Columns of df as numpy arrays, numeric columns are not copied"""
+    if cols is None:
+        cols = df.columns
+    return {col: df[col].to_numpy() for col in cols}
+
+
+class measurementResults:
+    """
+    Values calculated for each measurement, one row per measurement in
+    preallocated arrays. Rows of measurements that were skipped are NaN.
+
+    Parameters
+    ----------
+    n : int
+        Number of measurements
+
+    columns : list
+        Names of the result columns, in the order they are added to the
+        output
+
+    int_cols : list
+        Columns that stay integers if every measurement has a value
+    """
+
+    def __init__(self, n, columns, int_cols=()):
+        self.columns = {col: np.full(n, np.nan) for col in columns}
+        self.int_cols = set(int_cols)
+        self.calculated = np.zeros(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.calculated)
+
+    def __getitem__(self, col):
+        return self.columns[col]
+
+    def set(self, i, **values):
+        for col, value in values.items():
+            self.columns[col][i] = value
+        self.calculated[i] = True
+
+    def add_to(self, df, rows):
+        """
+        Adds the results to df which has one row for each measurement in
+        rows. Values of columns df already has are only replaced for the
+        measurements that were calculated.
+        """
+        calculated = self.calculated[rows]
+        if not calculated.any():
+            return df
+        for col, values in self.columns.items():
+            values = values[rows]
+            if col in self.int_cols and calculated.all():
+                values = values.astype(np.int64)
+            if col in df.columns:
+                df.loc[calculated, col] = values[calculated]
+            else:
+                df[col] = values
+        return df
@@ -2,19 +2,13 @@
 
 import logging
 import sys
+import numpy as np
 import pandas as pd
+from pandas.api.extensions import take
 
 logger = logging.getLogger("defaultLogger")
 
 
-def filter_with_mask(main_df, aux_df, id_value, id_col="chamber"):
-    main_mask = main_df[id_col] == id_value
-    aux_mask = aux_df[id_col] == id_value
-    masked_main = main_df[main_mask]
-    masked_aux = aux_df[aux_mask]
-    return masked_main, masked_aux
-
-
 def merge_by_id(main_df, cfg):
     aux_df = cfg.get("df")
     logger.debug(main_df.head())
@@ -22,7 +16,9 @@ def merge_by_id(main_df, cfg):
     main_df["idx_cp"] = main_df.index
     main_df["datetime"] = main_df["idx_cp"]
     main_df.drop("idx_cp", axis=1, inplace=True)
-    id_col = "chamber"
+    id_col = cfg.get("id_col")
+    if id_col is None:
+        id_col = "chamber"
     df = pd.merge(main_df, aux_df, left_on=id_col, right_on=id_col, suffixes=("", "_y"))
     df.drop(df.filter(regex="_y$").columns, axis=1, inplace=True)
     df.set_index("datetime", inplace=True, drop=True)
@@ -41,7 +37,7 @@ def merge_by_dtx(main_df, cfg):
         direction = "nearest"
     tolerance = cfg.get("tolerance")
     if tolerance is None:
-        tolerance = "30d"
+        tolerance = "30D"
     main_df["idx_cp"] = main_df.index
     aux_df[f"idx_cp_{name}"] = aux_df.index
     if is_df_valid(main_df) and is_df_valid(aux_df):
@@ -64,56 +60,496 @@ def merge_by_dtx(main_df, cfg):
         sys.exit(0)
 
 
+def align_id_col(main_ids, aux_ids):
+    """
+    merge_asof needs the id columns to have the same dtype, chamber numbers
+    are often object in one and int in the other.
+
+    args:
+    ---
+    main_ids, aux_ids -- pandas.series
+        id columns of the main and the aux data, they are not modified
+
+    returns:
+    ---
+    tuple
+        main_ids and aux_ids converted to the same dtype
+    """
+    if main_ids.dtype == aux_ids.dtype:
+        return main_ids, aux_ids
+    main_ids = main_ids.infer_objects()
+    aux_ids = aux_ids.infer_objects()
+    if main_ids.dtype == aux_ids.dtype:
+        return main_ids, aux_ids
+    try:
+        return main_ids, aux_ids.astype(main_ids.dtype)
+    except (ValueError, TypeError):
+        return main_ids.astype(str), aux_ids.astype(str)
+
+
+def measurement_values(df, meas_table, col):
+    """
+    Values of a per measurement column of meas_table for each row of df,
+    looked up with the measurement_id column. NaN for rows that aren't in
+    any measurement.
+    """
+    ids = df["measurement_id"].to_numpy()
+    values = take(meas_table[col].array, ids, allow_fill=True)
+    return pd.Series(values, index=df.index, name=col)
+
+
+def join_measurement_table(df, meas_table):
+    """
+    Adds the columns of meas_table to df in place of its measurement_id
+    column, columns that df already has are not replaced.
+    """
+    pos = df.columns.get_loc("measurement_id")
+    df = df.copy(deep=False)
+    for col in meas_table.columns:
+        if col in df.columns:
+            continue
+        df.insert(pos, col, measurement_values(df, meas_table, col))
+        pos += 1
+    return df.drop(columns="measurement_id")
+
+
 def merge_by_dtx_and_id(main_df, cfg):
     """
     This function merges dataframes by datetimeindex and an id column
     """
     aux_df = cfg.get("df")
     name = cfg.get("name")
-    id_col = "chamber"
-    dflist = []
-    # NOTE: chamber which is used as the "ID" column should be defined in the
-    # .ini
-    chamber_num_list = main_df["chamber"].unique().tolist()
+    id_col = cfg.get("id_col")
+    if id_col is None:
+        id_col = "chamber"
     direction = cfg.get("direction")
     if direction is None:
         direction = "nearest"
     tolerance = cfg.get("tolerance")
     if tolerance is None:
-        tolerance = "30d"
+        tolerance = "30D"
     main_df["idx_cp"] = main_df.index
-    # aux_df["idx_cp"] = aux_df.index
     aux_df[f"idx_cp_{name}"] = aux_df.index
-    for num in chamber_num_list:
-        if is_df_valid(main_df) and is_df_valid(aux_df):
-            masked_main, masked_aux = filter_with_mask(main_df, aux_df, num, id_col)
-            # logger.debug(
-            #     f"Merging {name}, direction: { direction}, tolerance: {tolerance}"
-            # )
-            df = pd.merge_asof(
-                masked_main,
-                masked_aux,
-                left_on="datetime",
-                right_on="datetime",
-                tolerance=pd.Timedelta(tolerance),
-                direction=direction,
-                suffixes=("", "_y"),
-            )
-            df[f"t_dif_{name}"] = (
-                df["idx_cp"] - df[f"idx_cp_{name}"]
-            ).dt.total_seconds()
-            df.drop(df.filter(regex="_y$").columns, axis=1, inplace=True)
-            df.set_index("datetime", inplace=True)
-            dflist.append(df)
-        else:
+    if is_df_valid(main_df) and is_df_valid(aux_df):
+        main_ids, aux_ids = align_id_col(main_df[id_col], aux_df[id_col])
+        if main_ids is not main_df[id_col] or aux_ids is not aux_df[id_col]:
+            # merge on shallow copies so the caller's id columns keep their dtype
+            main_df = main_df.copy(deep=False)
+            aux_df = aux_df.copy(deep=False)
+            main_df[id_col] = main_ids
+            aux_df[id_col] = aux_ids
+        # by groups the asof join per id so all ids are merged in one pass
+        df = pd.merge_asof(
+            main_df,
+            aux_df,
+            left_on="datetime",
+            right_on="datetime",
+            by=id_col,
+            tolerance=pd.Timedelta(tolerance),
+            direction=direction,
+            suffixes=("", "_y"),
+        )
+        df[f"t_dif_{name}"] = (df["idx_cp"] - df[f"idx_cp_{name}"]).dt.total_seconds()
+        df.drop(df.filter(regex="_y$").columns, axis=1, inplace=True)
+        df.set_index("datetime", inplace=True)
+        logger.debug(df.head())
+        return df
+    else:
+        logger.info("Dataframes are not properly sorted by datetimeindex.")
+        logger.debug(f"main_df: {main_df}")
+        logger.debug(f"aux_df: {aux_df}")
+        sys.exit(0)
+
+
+def plan_aux_merges(cfgs):
+    """
+    Collects the aux cfgs that are merged row by row into merge steps with
+    the defaults filled in.
+
+    args:
+    ---
+    cfgs -- list
+        parsed aux cfgs with the data in "df"
+
+    returns:
+    ---
+    list
+        list of dicts with keys name, method, df, id_col, direction and
+        tolerance
+    """
+    steps = []
+    for cfg in cfgs:
+        method = cfg.get("merge_method")
+        if method not in ("time", "id", "timeid"):
+            logger.info(f"Unknown merge_method {method} for {cfg.get('name')}")
+            continue
+        id_col = cfg.get("id_col")
+        if id_col is None and method != "time":
+            id_col = "chamber"
+        steps.append(
+            {
+                "name": cfg.get("name"),
+                "method": method,
+                "df": cfg.get("df"),
+                "id_col": id_col if method != "time" else None,
+                "direction": cfg.get("direction") or "nearest",
+                "tolerance": pd.Timedelta(cfg.get("tolerance") or "30D"),
+            }
+        )
+    return steps
+
+
+def asof_positions(times, aux_times, step, ids=None, aux_ids=None):
+    """
+    Row positions in the aux data matched to each main row like in
+    pd.merge_asof, -1 where nothing is within tolerance.
+    """
+    if ids is not None:
+        # grouped by id, leave it to merge_asof. merge_asof needs both keys
+        # in the same resolution
+        times = np.asarray(times, dtype="datetime64[ns]")
+        aux_times = np.asarray(aux_times, dtype="datetime64[ns]")
+        left = pd.DataFrame({"datetime": times, "_id": ids})
+        right = pd.DataFrame(
+            {"datetime": aux_times, "_id": aux_ids, "_pos": np.arange(len(aux_times))}
+        )
+        pos = pd.merge_asof(
+            left,
+            right,
+            on="datetime",
+            by="_id",
+            tolerance=step["tolerance"],
+            direction=step["direction"],
+        )["_pos"]
+        return pos.fillna(-1).to_numpy(dtype=np.int64)
+
+    t = np.asarray(times, dtype="datetime64[ns]").view(np.int64)
+    a = np.asarray(aux_times, dtype="datetime64[ns]").view(np.int64)
+    if len(a) == 0:
+        return np.full(len(t), -1, dtype=np.int64)
+    tol = step["tolerance"].value
+    direction = step["direction"]
+    # last aux row at or before and first aux row at or after each main row
+    back = np.searchsorted(a, t, side="right") - 1
+    fwd = np.searchsorted(a, t, side="left")
+    b_dif = np.where(back >= 0, t - a[np.clip(back, 0, None)], np.iinfo(np.int64).max)
+    f_dif = np.where(
+        fwd < len(a), a[np.clip(fwd, None, len(a) - 1)] - t, np.iinfo(np.int64).max
+    )
+    if direction == "backward":
+        return np.where(b_dif <= tol, back, -1)
+    if direction == "forward":
+        return np.where(f_dif <= tol, fwd, -1)
+    # ties go backward like in merge_asof
+    pos = np.where(f_dif < b_dif, fwd, back)
+    return np.where(np.minimum(b_dif, f_dif) <= tol, pos, -1)
+
+
+def id_positions(ids, aux_ids):
+    """
+    Pairs of main and aux row positions with the same id, in the order of
+    an inner pd.merge.
+    """
+    left = pd.DataFrame({"_id": ids, "_lpos": np.arange(len(ids))})
+    right = pd.DataFrame({"_id": aux_ids, "_rpos": np.arange(len(aux_ids))})
+    pairs = pd.merge(left, right, on="_id")
+    return pairs["_lpos"].to_numpy(), pairs["_rpos"].to_numpy()
+
+
+def merge_aux_cfgs(main_df, cfgs, meas_table=None):
+    """
+    Merges all aux cfgs into the main dataframe in one pass.
+
+    Each merge step only resolves the aux row matched to every main row, the
+    aux columns are gathered with these positions and added to the main
+    dataframe once at the end. The result is the same as running
+    merge_by_dtx, merge_by_id and merge_by_dtx_and_id one after another.
+
+    args:
+    ---
+    main_df -- pandas.dataframe
+        gas measurement data with a datetimeindex
+    cfgs -- list
+        parsed aux cfgs with the data in "df"
+    meas_table -- pandas.dataframe
+        per measurement columns, looked up with the measurement_id column of
+        main_df when an id column isn't in main_df
+
+    returns:
+    ---
+    pandas.dataframe
+    """
+    steps = plan_aux_merges(cfgs)
+    if not steps:
+        return main_df
+    if any(s["method"] != "id" for s in steps) and not is_df_valid(main_df):
+        logger.info("Dataframes are not properly sorted by datetimeindex")
+        sys.exit(0)
+
+    # positions of the main rows in the result, None while no id merge has
+    # dropped or repeated rows
+    rows = None
+    new_cols = {}
+    # aux sources read from the same file share their time axis
+    resolved = []
+
+    table_cols = [] if meas_table is None else list(meas_table.columns)
+
+    def current(col):
+        if col in new_cols:
+            return new_cols[col]
+        if col not in main_df.columns and col in table_cols:
+            ids = current("measurement_id")
+            return take(meas_table[col].array, ids, allow_fill=True)
+        values = main_df[col].to_numpy()
+        return values if rows is None else values[rows]
+
+    def current_index():
+        return main_df.index if rows is None else main_df.index[rows]
+
+    for step in steps:
+        aux_df = step["df"]
+        name = step["name"]
+        method = step["method"]
+        id_col = step["id_col"]
+        logger.info(f"merging {name} with method {method}")
+        existing = set(main_df.columns).union(new_cols, table_cols)
+
+        if method == "id":
+            lpos, rpos = id_positions(current(id_col), aux_df[id_col].to_numpy())
+            rows = lpos if rows is None else rows[lpos]
+            resolved = []
+            new_cols = {k: v[lpos] for k, v in new_cols.items()}
+            # merge_by_id drops the index copy
+            new_cols.pop("idx_cp", None)
+            aux_rows = aux_df.reset_index(drop=True).take(rpos)
+            for col in aux_rows.columns:
+                if col not in existing:
+                    new_cols[col] = aux_rows[col].to_numpy()
+            logger.debug(f"Merged {name} with method {method}")
+            continue
+
+        if not is_df_valid(aux_df):
             logger.info("Dataframes are not properly sorted by datetimeindex.")
-            logger.debug(f"main_df: {main_df}")
-            logger.debug(f"aux_df: {aux_df}")
             sys.exit(0)
-    df = pd.concat(dflist)
-    df.sort_index(inplace=True)
-    logger.debug(df.head())
-    return df
+        index = current_index()
+        ids = aux_ids = None
+        if method == "timeid":
+            main_ids = pd.Series(current(id_col))
+            ids, aux_ids = align_id_col(main_ids, aux_df[id_col])
+            ids = ids.to_numpy()
+            aux_ids = aux_ids.to_numpy()
+            if ids.dtype != main_ids.dtype and (
+                id_col in main_df.columns or id_col in new_cols
+            ):
+                # the result has the aligned ids like merge_asof gives
+                new_cols[id_col] = ids
+        pos = None
+        key = (step["direction"], step["tolerance"])
+        if method == "time":
+            for old_key, old_index, old_pos in resolved:
+                if old_key == key and old_index.equals(aux_df.index):
+                    pos = old_pos
+        if pos is None:
+            pos = asof_positions(index, aux_df.index, step, ids, aux_ids)
+            if method == "time":
+                resolved.append((key, aux_df.index, pos))
+
+        new_cols.setdefault("idx_cp", index.to_numpy())
+        # take with allow_fill leaves NaN for unmatched rows and upcasts the
+        # same way as merge_asof
+        for col in aux_df.columns:
+            if col not in existing and col != id_col:
+                new_cols[col] = take(aux_df[col].array, pos, allow_fill=True)
+        new_cols[f"idx_cp_{name}"] = take(aux_df.index.array, pos, allow_fill=True)
+        t = np.asarray(index, dtype="datetime64[ns]").view(np.int64)
+        a = np.asarray(aux_df.index, dtype="datetime64[ns]").view(np.int64)
+        t_dif = np.full(len(t), np.nan)
+        hit = pos >= 0
+        t_dif[hit] = (t[hit] - a[pos[hit]]) / 1e9
+        new_cols[f"t_dif_{name}"] = t_dif
+        logger.debug(f"Merged {name} with method {method}")
+
+    base = main_df if rows is None else main_df.iloc[rows]
+    if "idx_cp" in base.columns:
+        base = base.drop(columns="idx_cp")
+    # inserting the arrays one by one keeps them as their own blocks instead
+    # of copying them all into one consolidated block
+    merged = base.copy(deep=False)
+    for col in list(new_cols):
+        merged[col] = new_cols.pop(col)
+    return merged
+
+
+def window_stats(times, values, starts, ends, direction="nearest", tolerance=None):
+    """
+    Statistics of values inside each start - end window, calculated from
+    sorted arrays without merging anything to the gas measurement.
+
+    Windows without any values get the value of the closest sample in the
+    given direction, if it's within tolerance.
+
+    Parameters
+    ----------
+    times : np.array
+        sorted int64 timestamps of the aux data
+
+    values : np.array
+        float values of the aux data
+
+    starts, ends : np.array
+        int64 timestamps of the measurement windows
+
+    direction : str
+        nearest, backward or forward, like in pd.merge_asof
+
+    tolerance : int
+        max distance in nanoseconds for the closest sample
+
+    Returns
+    -------
+    mean, vmin, vmax, count, t_dif : np.array
+        t_dif is the distance in seconds to the closest sample, 0 if there are
+        samples inside the window
+    """
+    n = len(starts)
+    i0 = np.searchsorted(times, starts, side="left")
+    i1 = np.searchsorted(times, ends, side="left")
+
+    valid = ~np.isnan(values)
+    csum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    ccount = np.concatenate([[0], np.cumsum(valid)])
+    count = ccount[i1] - ccount[i0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (csum[i1] - csum[i0]) / count
+
+    vmin = np.full(n, np.nan)
+    vmax = np.full(n, np.nan)
+    has = count > 0
+    if has.any():
+        # reduceat reduces from each index to the next one, so each window
+        # needs its own start and end index
+        bounds = np.column_stack([i0[has], i1[has]]).ravel()
+        padded = np.append(values, np.nan)
+        vmin[has] = np.fmin.reduceat(padded, bounds)[::2]
+        vmax[has] = np.fmax.reduceat(padded, bounds)[::2]
+
+    # closest sample for windows without values
+    t_dif = np.zeros(n)
+    empty = ~has
+    if empty.any() and len(times):
+        before = i0[empty] - 1
+        after = i1[empty]
+        d_before = np.where(
+            before >= 0, starts[empty] - times[np.clip(before, 0, None)], np.inf
+        )
+        d_after = np.where(
+            after < len(times),
+            times[np.clip(after, None, len(times) - 1)] - ends[empty],
+            np.inf,
+        )
+        if direction == "backward":
+            d_after[:] = np.inf
+        if direction == "forward":
+            d_before[:] = np.inf
+        use_before = d_before <= d_after
+        dist = np.where(use_before, d_before, d_after)
+        idx = np.where(use_before, before, after)
+        ok = np.isfinite(dist)
+        if tolerance is not None:
+            ok &= dist <= tolerance
+        nearest = np.full(len(idx), np.nan)
+        nearest[ok] = values[idx[ok].astype(int)]
+        mean[empty] = nearest
+        vmin[empty] = nearest
+        vmax[empty] = nearest
+        # positive when the sample is before the window like in merge_by_dtx
+        signed = np.where(use_before, dist, -dist) / 1e9
+        t_dif[empty] = np.where(ok, signed, np.nan)
+    return mean, vmin, vmax, count, t_dif
+
+
+def aggregate_by_window(cfg, measurements, id_col=None):
+    """
+    Aggregate aux data into statistics for each measurement window instead of
+    merging it into every row of the gas measurement.
+
+    Parameters
+    ----------
+    cfg : dict
+        parsed aux cfg with the data in "df"
+
+    measurements : measurementTable
+
+    id_col : str
+        if given, only aux rows with the same id as the measurement are used
+
+    Returns
+    -------
+    stats : pd.DataFrame
+        one row per measurement, for each aux column the mean with the column
+        name and _min, _max and _count columns, plus t_dif_<name>
+    """
+    aux_df = cfg.get("df")
+    name = cfg.get("name")
+    direction = cfg.get("direction")
+    if direction is None:
+        direction = "nearest"
+    tolerance = cfg.get("tolerance")
+    if tolerance is None:
+        tolerance = "30D"
+    tolerance = pd.Timedelta(tolerance).value
+
+    if not aux_df.index.is_monotonic_increasing:
+        aux_df = aux_df.sort_index()
+    starts = measurements.start
+    ends = measurements.end
+    times = aux_df.index.as_unit("ns").asi8
+    cols = [
+        col
+        for col in aux_df.select_dtypes("number").columns
+        if col != id_col and "idx_cp" not in col
+    ]
+
+    n = len(measurements)
+    stats = {}
+    for col in cols:
+        stats[col] = np.full(n, np.nan)
+        stats[f"{col}_min"] = np.full(n, np.nan)
+        stats[f"{col}_max"] = np.full(n, np.nan)
+        stats[f"{col}_count"] = np.zeros(n, dtype=int)
+    stats[f"t_dif_{name}"] = np.full(n, np.nan)
+
+    if id_col is None:
+        groups = [(np.ones(n, dtype=bool), np.ones(len(times), dtype=bool))]
+    else:
+        ids = pd.Series(measurements.id).infer_objects()
+        aux_ids = aux_df[id_col].infer_objects()
+        if ids.dtype != aux_ids.dtype:
+            ids = ids.astype(str)
+            aux_ids = aux_ids.astype(str)
+        groups = [
+            (ids.values == id_value, aux_ids.values == id_value)
+            for id_value in ids.unique()
+        ]
+
+    for m_mask, a_mask in groups:
+        for col in cols:
+            values = aux_df[col].values[a_mask].astype(float)
+            mean, vmin, vmax, count, t_dif = window_stats(
+                times[a_mask],
+                values,
+                starts[m_mask],
+                ends[m_mask],
+                direction,
+                tolerance,
+            )
+            stats[col][m_mask] = mean
+            stats[f"{col}_min"][m_mask] = vmin
+            stats[f"{col}_max"][m_mask] = vmax
+            stats[f"{col}_count"][m_mask] = count
+            stats[f"t_dif_{name}"][m_mask] = t_dif
+    return pd.DataFrame(stats)
 
 
 def is_df_valid(df):
@@ -141,7 +577,8 @@ def is_df_valid(df):
         logger.info("Index is not a datetimeindex.")
         return False
 
-    if df.index.is_monotonic_decreasing:
+    # an empty or single row index is both increasing and decreasing
+    if df.index.is_monotonic_decreasing and not df.index.is_monotonic_increasing:
         logger.info("Datetimeindex goes backwards.")
         logger.debug(df)
         return False
@@ -62,6 +62,16 @@ class iniHandler:
         self.def_press = float(self.defaults.get("default_pressure"))
         self.def_temp = float(self.defaults.get("default_temperature"))
         self.excel_path = self.defaults.get("excel_directory")
+        # sparklines of each .ini have their own directory so that runs of
+        # other .inis don't touch them
+        fig_name = self.ini_name or Path(self.ini_path).stem
+        self.fig_path = self.defaults.get("fig_directory") or f"figs/{fig_name}"
+        self.compact_dtypes = self.defaults.get("compact_dtypes") == "1"
+        # processes used for rendering sparklines, the process pool is only
+        # used if more than one worker is asked for
+        workers = self.defaults.get("sparkline_workers")
+        self.sparkline_workers = int(workers) if workers else 1
+        self.sparkline_backend = self.defaults.get("sparkline_backend") or "matplotlib"
         self.s_ts = self.defaults.get("start_ts")
         self.e_ts = self.defaults.get("end_ts")
 
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+import json
+import time
+import hashlib
+import logging
+import datetime
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger("defaultLogger")
+
+
+def init_cache(ifdb_dict):
+    """
+    Creates a query cache from the influxDB section of the .ini, returns None
+    if cache_dir is not defined.
+    """
+    cache_dir = ifdb_dict.get("cache_dir")
+    if not cache_dir:
+        return None
+    ttl = ifdb_dict.get("cache_ttl_hours")
+    max_size = ifdb_dict.get("cache_max_size_mb")
+    mutable = ifdb_dict.get("cache_mutable_minutes")
+    return queryCache(
+        cache_dir,
+        ttl=datetime.timedelta(hours=float(ttl)) if ttl else None,
+        max_size=int(float(max_size) * 1024 * 1024) if max_size else None,
+        mutable_minutes=float(mutable) if mutable else 0,
+    )
+
+
+def find_gaps(segments, start, stop):
+    """
+    Finds the parts of start - stop that are not covered by the segments.
+
+    Parameters
+    ----------
+    segments : list
+        list of (start, stop) tuples
+
+    start : datetime.datetime
+
+    stop : datetime.datetime
+
+    Returns
+    -------
+    gaps : list
+        list of (start, stop) tuples which need to be queried
+    """
+    gaps = []
+    current = start
+    for s, e in sorted(segments):
+        if e <= current:
+            continue
+        if s >= stop:
+            break
+        if s > current:
+            gaps.append((current, s))
+        current = max(current, e)
+        if current >= stop:
+            break
+    if current < stop:
+        gaps.append((current, stop))
+    return gaps
+
+
+class queryCache:
+    """
+    On disk cache for influxDB queries.
+
+    Each (bucket, measurement, fields) combination gets its own folder with
+    the already fetched time ranges stored as pickled dataframes. Only the
+    ranges that aren't in the cache are queried from the database.
+    """
+
+    index_name = "index.json"
+    max_segments = 8
+
+    def __init__(self, cache_dir, ttl=None, max_size=None, mutable_minutes=0):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_size = max_size
+        # data newer than this is never stored, the db might still be
+        # receiving it
+        self.mutable = datetime.timedelta(minutes=mutable_minutes)
+
+    def key_dir(self, bucket, measurement, fields):
+        key = "|".join([str(bucket), str(measurement), ",".join(sorted(fields))])
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return self.cache_dir / digest
+
+    def load_index(self, kdir):
+        path = kdir / self.index_name
+        if not path.is_file():
+            return []
+        with open(path) as f:
+            segs = json.load(f)
+        for seg in segs:
+            seg["start"] = datetime.datetime.fromisoformat(seg["start"])
+            seg["stop"] = datetime.datetime.fromisoformat(seg["stop"])
+        return segs
+
+    def save_index(self, kdir, segs):
+        kdir.mkdir(parents=True, exist_ok=True)
+        out = [
+            {**seg, "start": seg["start"].isoformat(), "stop": seg["stop"].isoformat()}
+            for seg in segs
+        ]
+        with open(kdir / self.index_name, "w") as f:
+            json.dump(out, f)
+
+    def drop_segment(self, kdir, seg):
+        if seg.get("file"):
+            (kdir / seg["file"]).unlink(missing_ok=True)
+
+    def expire(self, kdir, segs):
+        """Drop segments older than ttl."""
+        if self.ttl is None:
+            return segs
+        oldest = time.time() - self.ttl.total_seconds()
+        keep = []
+        for seg in segs:
+            if seg["created"] < oldest:
+                self.drop_segment(kdir, seg)
+            else:
+                keep.append(seg)
+        return keep
+
+    def read_segment(self, kdir, seg):
+        if not seg.get("file"):
+            return None
+        path = kdir / seg["file"]
+        if not path.is_file():
+            return None
+        return pd.read_pickle(path)
+
+    def write_segment(self, kdir, df, start, stop):
+        seg = {
+            "start": start,
+            "stop": stop,
+            "file": None,
+            "size": 0,
+            "created": time.time(),
+            "used": time.time(),
+        }
+        if df is not None and not df.empty:
+            kdir.mkdir(parents=True, exist_ok=True)
+            name = f"{start:%Y%m%d%H%M%S}_{stop:%Y%m%d%H%M%S}.pkl"
+            df.to_pickle(kdir / name)
+            seg["file"] = name
+            seg["size"] = (kdir / name).stat().st_size
+        return seg
+
+    def coalesce(self, kdir, segs):
+        """
+        Merge touching segments into one when there are too many of them.
+        """
+        if len(segs) <= self.max_segments:
+            return segs
+        segs = sorted(segs, key=lambda seg: seg["start"])
+        merged = [segs[0]]
+        for seg in segs[1:]:
+            last = merged[-1]
+            if seg["start"] > last["stop"]:
+                merged.append(seg)
+                continue
+            dfs = [self.read_segment(kdir, s) for s in (last, seg)]
+            dfs = [df for df in dfs if df is not None]
+            df = None
+            if dfs:
+                df = pd.concat(dfs).drop_duplicates(subset="datetime")
+            new = self.write_segment(
+                kdir, df, last["start"], max(last["stop"], seg["stop"])
+            )
+            for old in (last, seg):
+                if old.get("file") != new.get("file"):
+                    self.drop_segment(kdir, old)
+            merged[-1] = new
+        return merged
+
+    def evict(self):
+        """
+        Drop least recently used segments until the cache fits in max_size.
+        """
+        if self.max_size is None or not self.cache_dir.exists():
+            return
+        indexes = {
+            kdir: self.load_index(kdir)
+            for kdir in self.cache_dir.iterdir()
+            if (kdir / self.index_name).is_file()
+        }
+        all_segs = [(seg, kdir) for kdir, segs in indexes.items() for seg in segs]
+        total = sum(seg["size"] for seg, _ in all_segs)
+        for seg, kdir in sorted(all_segs, key=lambda s: s[0]["used"]):
+            if total <= self.max_size:
+                break
+            self.drop_segment(kdir, seg)
+            indexes[kdir].remove(seg)
+            total -= seg["size"]
+        for kdir, segs in indexes.items():
+            self.save_index(kdir, segs)
+
+    def read(self, bucket, measurement, fields, start, stop, fetch):
+        """
+        Read data between start and stop, querying only the missing ranges.
+
+        Parameters
+        ----------
+        bucket : str
+
+        measurement : str
+
+        fields : list
+
+        start : datetime.datetime
+
+        stop : datetime.datetime
+
+        fetch : callable
+            fetch(start, stop) queries the database and returns a dataframe
+            with a datetime column, or None if there is no data. If it raises
+            the range is left out and queried again on the next read.
+
+        Returns
+        -------
+        df : pd.DataFrame or None
+        """
+        kdir = self.key_dir(bucket, measurement, fields)
+        segs = self.expire(kdir, self.load_index(kdir))
+        gaps = find_gaps([(s["start"], s["stop"]) for s in segs], start, stop)
+        logger.debug(f"Cache hit for {len(segs)} segments, querying {len(gaps)}.")
+
+        horizon = datetime.datetime.now(datetime.timezone.utc).replace(
+            tzinfo=None, microsecond=0
+        )
+        horizon = horizon - self.mutable
+
+        frames = []
+        for seg in segs:
+            if seg["stop"] <= start or seg["start"] >= stop:
+                continue
+            seg["used"] = time.time()
+            df = self.read_segment(kdir, seg)
+            if df is not None:
+                frames.append(df)
+        for gap_start, gap_stop in gaps:
+            try:
+                df = fetch(gap_start, gap_stop)
+            except Exception as e:
+                # a failed query is not "no data", don't cache it
+                logger.warning(f"Query from {gap_start} to {gap_stop} failed: {e}")
+                continue
+            if df is not None:
+                frames.append(df)
+            # don't store the part of the range that can still change
+            store_stop = min(gap_stop, horizon)
+            if store_stop <= gap_start:
+                continue
+            if df is not None:
+                df = df[df["datetime"] < store_stop]
+            segs.append(self.write_segment(kdir, df, gap_start, store_stop))
+
+        segs = self.coalesce(kdir, segs)
+        self.save_index(kdir, segs)
+        self.evict()
+
+        if not frames:
+            return None
+        df = pd.concat(frames)
+        df = df[(df["datetime"] >= start) & (df["datetime"] < stop)]
+        df = df.drop_duplicates(subset="datetime")
+        df = df.sort_values("datetime").reset_index(drop=True)
+        if df.empty:
+            return None
+        return df
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import os
+import logging
+import importlib.util
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger("defaultLogger")
+
+# format: file extension, parquet and feather need pyarrow
+FORMATS = {
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "pickle": ".pkl",
+}
+
+
+def pick_format(fmt):
+    """
+    Use fmt if the libraries it needs are installed, otherwise fall back to
+    pickle which only needs pandas
+    """
+    if fmt not in FORMATS:
+        raise Exception(f"Unknown result_store {fmt}, use one of {list(FORMATS)}.")
+    if fmt == "pickle" or importlib.util.find_spec("pyarrow") is not None:
+        return fmt
+    if fmt == "parquet" and importlib.util.find_spec("fastparquet") is not None:
+        return fmt
+    logger.warning(f"{fmt} needs pyarrow, storing results as pickle instead.")
+    return "pickle"
+
+
+class resultStore:
+    """
+    Summarized fluxes on disk, partitioned by date and chamber:
+
+        <root>/date=2021-10-03/chamber=1/data.parquet
+
+    Each run only rewrites the partitions it has rows for, old rows of a
+    partition are kept unless the run has a row with the same datetime.
+    Partitions are written to a temporary file that replaces the old one,
+    so a crashed run never leaves a half written partition behind.
+
+    Parameters
+    ----------
+    root : str or Path
+        Directory of the store
+
+    fmt : str
+        "parquet", "feather" or "pickle"
+
+    id_col : str
+        Column the partitions are split by after the date
+    """
+
+    time_col = "datetime"
+
+    def __init__(self, root, fmt="parquet", id_col="chamber"):
+        self.root = Path(root)
+        self.fmt = pick_format(fmt)
+        self.id_col = id_col
+
+    def partition_dir(self, date, chamber=None):
+        path = self.root / f"date={date}"
+        if chamber is not None:
+            chamber = str(chamber).replace(os.sep, "_")
+            path = path / f"{self.id_col}={chamber}"
+        return path
+
+    def write_file(self, df, path):
+        """Write df to path through a temporary file in the same directory"""
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        df = df.reset_index()
+        try:
+            if self.fmt == "parquet":
+                df.to_parquet(tmp, index=False)
+            elif self.fmt == "feather":
+                df.to_feather(tmp)
+            else:
+                df.to_pickle(tmp, compression=None)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def read_file(self, path, columns=None):
+        if columns is not None:
+            columns = [self.time_col] + [c for c in columns if c != self.time_col]
+        if path.suffix == ".parquet":
+            df = pd.read_parquet(path, columns=columns)
+        elif path.suffix == ".feather":
+            df = pd.read_feather(path, columns=columns)
+        else:
+            df = pd.read_pickle(path, compression=None)
+            if columns is not None:
+                df = df[[c for c in columns if c in df.columns]]
+        return df.set_index(self.time_col)
+
+    def data_file(self, part):
+        """The data file of a partition directory, whatever its format"""
+        files = sorted(part.glob("data.*"))
+        return files[0] if files else None
+
+    def append(self, df):
+        """
+        Add the rows of df to the store.
+
+        args:
+        ---
+        df -- pandas.dataframe
+            Summarized fluxes with a datetimeindex
+
+        returns:
+        ---
+        int
+            Number of partitions written
+        """
+        if df.empty:
+            return 0
+        df = df.rename_axis(self.time_col)
+        keys = [df.index.strftime("%Y-%m-%d")]
+        if self.id_col in df.columns:
+            keys.append(df[self.id_col].astype(str))
+        written = 0
+        for key, part in df.groupby(keys, sort=True):
+            part_dir = self.partition_dir(*key)
+            part_dir.mkdir(parents=True, exist_ok=True)
+            path = part_dir / f"data{FORMATS[self.fmt]}"
+            old_path = self.data_file(part_dir)
+            if old_path is not None:
+                old = self.read_file(old_path)
+                old = old[~old.index.isin(part.index)]
+                if not old.empty:
+                    part = pd.concat([old, part]).sort_index()
+            self.write_file(part, path)
+            if old_path is not None and old_path != path:
+                old_path.unlink()
+            written += 1
+        logger.info(f"Wrote {written} partitions to {self.root}.")
+        return written
+
+    def partitions(self, start=None, end=None, chambers=None):
+        """
+        Data files of the partitions that can have rows between start and
+        end and of the given chambers, the others are never opened
+        """
+        first = pd.Timestamp(start).strftime("%Y-%m-%d") if start else None
+        last = pd.Timestamp(end).strftime("%Y-%m-%d") if end else None
+        if chambers is not None:
+            chambers = {str(chamber) for chamber in chambers}
+        files = []
+        for date_dir in sorted(self.root.glob("date=*")):
+            date = date_dir.name.split("=", 1)[1]
+            if (first and date < first) or (last and date > last):
+                continue
+            parts = [date_dir]
+            if any(date_dir.glob(f"{self.id_col}=*")):
+                parts = sorted(date_dir.glob(f"{self.id_col}=*"))
+            for part in parts:
+                chamber = part.name.split("=", 1)[1] if part != date_dir else None
+                if chambers is not None and chamber not in chambers:
+                    continue
+                path = self.data_file(part)
+                if path is not None:
+                    files.append(path)
+        return files
+
+    def read(self, start=None, end=None, chambers=None, columns=None):
+        """
+        Read the stored fluxes back into a dataframe.
+
+        args:
+        ---
+        start, end -- str or pd.Timestamp
+            Only rows between start and end, inclusive
+        chambers -- list
+            Only rows of these chambers
+        columns -- list
+            Only these columns, all if None
+
+        returns:
+        ---
+        pandas.dataframe
+            Rows sorted by datetime
+        """
+        files = self.partitions(start, end, chambers)
+        if not files:
+            return pd.DataFrame()
+        df = pd.concat([self.read_file(f, columns) for f in files]).sort_index()
+        if start or end:
+            df = df.loc[start:end]
+        return df
+
+    def to_csv(self, path, **filters):
+        """Write the fluxes read() selects with filters to a .csv"""
+        df = self.read(**filters)
+        df.to_csv(path)
+        return df
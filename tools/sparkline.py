@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+"""
+Sparklines rasterized straight into an RGBA array and written as PNG,
+sparkline_backend = raster in the .ini.
+
+The images look like the ones create_sparkline makes with matplotlib: the
+same size, colors, alpha and line widths, but drawing one takes about a
+millisecond instead of 20 ms.
+"""
+
+import zlib
+import struct
+import logging
+import numpy as np
+from functools import lru_cache
+
+from matplotlib.dates import date2num
+
+logger = logging.getLogger("defaultLogger")
+
+# size of the matplotlib sparklines, 0.8 x 0.175 inches at 150 dpi cropped
+# to the plotted rectangles
+DPI = 150
+WIDTH = 94
+HEIGHT = 21
+# pixel coordinates of the plot window rectangle, its edges are centered on
+# these
+LEFT, RIGHT, TOP, BOTTOM = 5.0, 89.0, 1.0, 19.0
+# linewidths in points converted to pixels
+EDGE_WIDTH = 1.0 * DPI / 72
+LINE_WIDTH = 0.3 * DPI / 72
+# distance between the points the line is sampled at, in pixels
+LINE_STEP = 0.25
+
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+GREY = (128, 128, 128)
+GREEN = (0, 128, 0)
+RECT_ALPHA = 0.2
+
+
+def axis_coverage(lo, hi, n):
+    """How much of each of n pixels is covered by the interval lo:hi"""
+    edges = np.arange(n)
+    return np.clip(np.minimum(hi, edges + 1) - np.maximum(lo, edges), 0, 1)
+
+
+def rect_coverage(x0, x1, y0, y1, pad=0.0):
+    """Coverage of the rectangle x0:x1, y0:y1 grown by pad on each side"""
+    cx = axis_coverage(x0 - pad, x1 + pad, WIDTH)
+    cy = axis_coverage(y0 - pad, y1 + pad, HEIGHT)
+    return np.outer(cy, cx)
+
+
+def line_coverage(x, y, width=LINE_WIDTH):
+    """
+    Antialiased coverage of a polyline. Points are sampled along each
+    segment and their area is split between the four nearest pixels.
+    Segments with a NaN end are left out like matplotlib does.
+    """
+    if len(x) < 2:
+        return np.zeros((HEIGHT, WIDTH))
+    x0, x1, y0, y1 = x[:-1], x[1:], y[:-1], y[1:]
+    ok = np.isfinite(x0) & np.isfinite(x1) & np.isfinite(y0) & np.isfinite(y1)
+    x0, x1, y0, y1 = x0[ok], x1[ok], y0[ok], y1[ok]
+    lengths = np.hypot(x1 - x0, y1 - y0)
+    n = np.maximum(np.ceil(lengths / LINE_STEP).astype(np.int64), 1)
+    seg = np.repeat(np.arange(len(n)), n)
+    first = np.repeat(np.cumsum(n) - n, n)
+    t = (np.arange(n.sum()) - first + 0.5) / n[seg]
+    # pixel i is centered on i + 0.5
+    sx = x0[seg] + t * (x1 - x0)[seg] - 0.5
+    sy = y0[seg] + t * (y1 - y0)[seg] - 0.5
+    area = (lengths / n)[seg] * width
+
+    ix = np.floor(sx).astype(np.int64)
+    iy = np.floor(sy).astype(np.int64)
+    fx = sx - ix
+    fy = sy - iy
+    # the four neighbours of every sample, in a buffer with a one pixel
+    # border so that samples on the edges don't need to be masked
+    px = np.concatenate((ix, ix + 1, ix, ix + 1)) + 1
+    py = np.concatenate((iy, iy, iy + 1, iy + 1)) + 1
+    weights = np.concatenate(
+        ((1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy)
+    ) * np.tile(area, 4)
+    px = np.clip(px, 0, WIDTH + 1)
+    py = np.clip(py, 0, HEIGHT + 1)
+    coverage = np.bincount(
+        py * (WIDTH + 2) + px, weights, minlength=(HEIGHT + 2) * (WIDTH + 2)
+    ).reshape(HEIGHT + 2, WIDTH + 2)
+    return np.minimum(coverage[1:-1, 1:-1], 1)
+
+
+def blend(image, coverage, color, alpha=1.0):
+    """Draw color over image where coverage > 0, in place"""
+    a = (coverage * alpha)[:, :, None]
+    image *= 1 - a
+    image += a * np.asarray(color, dtype=np.float64)
+
+
+def draw_rect(image, x0, x1, color):
+    """Rectangle from x0 to x1 over the whole height, with its edge"""
+    face = rect_coverage(x0, x1, TOP, BOTTOM)
+    half = EDGE_WIDTH / 2
+    edge = rect_coverage(x0, x1, TOP, BOTTOM, half)
+    edge -= rect_coverage(x0 + half, x1 - half, TOP + half, BOTTOM - half)
+    blend(image, face, color, RECT_ALPHA)
+    blend(image, edge, color, RECT_ALPHA)
+
+
+@lru_cache(maxsize=1)
+def background():
+    """White image with the plot window rectangle, the same for every plot"""
+    image = np.empty((HEIGHT, WIDTH, 3))
+    image[:] = WHITE
+    draw_rect(image, LEFT, RIGHT, GREY)
+    image.flags.writeable = False
+    return image
+
+
+def rasterize_sparkline(x, y, rects):
+    """
+    Draw a sparkline into an RGBA array.
+
+    args:
+    ---
+    x -- np.array
+        Times as matplotlib date numbers
+    y -- np.array
+        Gas values
+    rects -- tuple
+        Bounds of the rectangles from create_rects
+
+    returns:
+    ---
+    np.array
+        uint8 array with shape (HEIGHT, WIDTH, 4)
+    """
+    wrec_x, wrec_w, srec_x, srec_w, rec_y, rec_h = rects
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    def to_px(values):
+        return LEFT + (values - wrec_x) / wrec_w * (RIGHT - LEFT)
+
+    if rec_h > 0:
+        py = BOTTOM - (y - rec_y) / rec_h * (BOTTOM - TOP)
+    else:
+        # flat line in the middle like matplotlib does with a singular ylim
+        py = np.where(np.isfinite(y), (TOP + BOTTOM) / 2, np.nan)
+
+    image = background().copy()
+    # patches are drawn under the line like in matplotlib
+    draw_rect(image, to_px(srec_x), to_px(srec_x + srec_w), GREEN)
+    blend(image, line_coverage(to_px(x), py), RED)
+
+    rgba = np.full((HEIGHT, WIDTH, 4), 255, dtype=np.uint8)
+    rgba[:, :, :3] = np.round(image)
+    return rgba
+
+
+def png_chunk(tag, data):
+    crc = zlib.crc32(tag + data)
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+
+def encode_png(rgba, dpi=DPI):
+    """8 bit RGBA array as PNG bytes"""
+    height, width, _ = rgba.shape
+    rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    # first byte of each row is the filter type, 0 is none
+    rows[:, 1:] = rgba.reshape(height, width * 4)
+    px_per_m = round(dpi / 0.0254)
+    return b"".join(
+        (
+            b"\x89PNG\r\n\x1a\n",
+            png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+            png_chunk(b"pHYs", struct.pack(">IIB", px_per_m, px_per_m, 1)),
+            png_chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)),
+            png_chunk(b"IEND", b""),
+        )
+    )
+
+
+def raster_sparkline(df, filename, gas, rects):
+    """
+    Create a sparkline like create_sparkline without matplotlib
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The gas column with a datetimeindex
+    filename : str
+    gas : str
+    rects : tuple
+        Bounds of the rectangles from create_rects
+    """
+    x = date2num(df.index)
+    rgba = rasterize_sparkline(x, df[gas].to_numpy(dtype=np.float64), rects)
+    with open(filename, "wb") as f:
+        f.write(encode_png(rgba))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import json
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("defaultLogger")
+
+
+class sparklineCache:
+    """
+    Content addressed index of the rendered sparklines.
+
+    Every figure directory, eg. figs/<name>/CO2/2021-10-03/, has an
+    index.json with the key of each png in it. The key is a hash of the
+    plotted samples, the rectangle bounds and the backend, so a sparkline is
+    only rendered again if what it shows has changed or the png is gone.
+
+    Parameters
+    ----------
+    backend : str
+        sparkline_backend the pngs are rendered with
+    """
+
+    index_name = "index.json"
+    # pngs are named by the start of the measurement
+    name_fmt = "%Y%m%d%H%M%S"
+
+    def __init__(self, backend="matplotlib"):
+        self.backend = backend
+        # figure directory: {png name: key}
+        self.indexes = {}
+        # fig_path: key of the sparklines that need to be rendered
+        self.pending = {}
+        # fig_path of the sparklines that are already up to date
+        self.current = set()
+
+    def key(self, df, gas, rects):
+        """Hash of everything that is drawn in the sparkline"""
+        digest = hashlib.sha1(f"{self.backend}|{gas}".encode())
+        digest.update(np.asarray(df.index, dtype="datetime64[ns]").tobytes())
+        digest.update(df[gas].to_numpy(dtype=np.float64).tobytes())
+        digest.update(np.asarray(rects, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def load_index(self, fig_dir):
+        if fig_dir in self.indexes:
+            return self.indexes[fig_dir]
+        path = fig_dir / self.index_name
+        index = {}
+        if path.is_file():
+            with open(path) as f:
+                index = json.load(f)
+        self.indexes[fig_dir] = index
+        return index
+
+    def save(self):
+        for fig_dir, index in self.indexes.items():
+            if not fig_dir.exists():
+                continue
+            with open(fig_dir / self.index_name, "w") as f:
+                json.dump(index, f)
+
+    def check(self, fig_path, df, gas, rects):
+        """
+        Check if the png at fig_path already shows this sparkline, otherwise
+        it's added to pending.
+
+        returns:
+        ---
+        bool
+            True if the sparkline doesn't need to be rendered
+        """
+        fig_path = Path(fig_path)
+        key = self.key(df, gas, rects)
+        index = self.load_index(fig_path.parent)
+        if index.get(fig_path.name) == key and fig_path.is_file():
+            self.current.add(str(fig_path))
+            return True
+        self.pending[str(fig_path)] = key
+        return False
+
+    def update(self, done):
+        """
+        Store the keys of the sparklines that were rendered, sparklines that
+        failed are removed from the index.
+
+        args:
+        ---
+        done -- set
+            fig_path of the rendered sparklines
+
+        returns:
+        ---
+        set
+            fig_path of every sparkline that is up to date
+        """
+        for fig_path, key in self.pending.items():
+            path = Path(fig_path)
+            index = self.load_index(path.parent)
+            if fig_path in done:
+                index[path.name] = key
+            else:
+                index.pop(path.name, None)
+        self.pending = {}
+        return self.current | set(done)
+
+    def remove_orphans(self, fig_dirs, start, end, expected):
+        """
+        Delete pngs between start and end that don't belong to any
+        measurement of the run anymore, eg. when the measurement times have
+        changed or a measurement has no data. Only pngs recorded in the
+        index.json of their directory are deleted, other files are left as
+        they are.
+
+        args:
+        ---
+        fig_dirs -- iterable
+            Figure directories of the days in the run
+        start, end -- pd.Timestamp
+            Starts of the first and the last measurement of the run
+        expected -- set
+            fig_path of every sparkline of the run
+
+        returns:
+        ---
+        int
+            Number of removed pngs
+        """
+        removed = 0
+        for fig_dir in map(Path, fig_dirs):
+            if not fig_dir.exists():
+                continue
+            index = self.load_index(fig_dir)
+            for name in list(index):
+                png = fig_dir / name
+                if str(png) in expected:
+                    continue
+                time = pd.to_datetime(png.stem, format=self.name_fmt, errors="coerce")
+                if pd.isna(time) or not start <= time <= end:
+                    continue
+                png.unlink(missing_ok=True)
+                del index[name]
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} orphaned sparklines.")
+        return removed
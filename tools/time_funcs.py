@@ -3,11 +3,26 @@
 import datetime
 import re
 import logging
-from numpy import array
+from functools import lru_cache
+from numpy import (
+    arange,
+    array,
+    asarray,
+    char,
+    datetime_as_string,
+    int64,
+    uint8,
+    uint32,
+    where,
+    zeros,
+)
 from pandas.api.types import is_datetime64_any_dtype
 
 logger = logging.getLogger("defaultLogger")
 
+# datetime.date(1970, 1, 1).toordinal()
+ORDINAL_EPOCH = 719163
+
 
 def rm_tz(df):
     """
@@ -33,6 +48,201 @@ def rm_tz(df):
     return df
 
 
+# strftime directives that always have the same width: (width, field)
+FIXED_WIDTH = {
+    "%Y": (4, "year"),
+    "%y": (2, "year"),
+    "%m": (2, "month"),
+    "%d": (2, "day"),
+    "%H": (2, "hour"),
+    "%M": (2, "minute"),
+    "%S": (2, "second"),
+}
+
+
+def fixed_width_layout(fmt):
+    """
+    Character offsets of the fields in strings formatted with fmt
+
+    args:
+    ---
+    fmt -- str
+        strftime format, eg. "%H:%M:%S"
+
+    returns:
+    ---
+    layout -- dict
+        width of the strings, fields as {"hour": (start, stop), ...} and
+        literals as [(position, character), ...]. None if fmt has
+        directives that don't have a fixed width.
+    """
+    fields = {}
+    literals = []
+    pos = 0
+    i = 0
+    while i < len(fmt):
+        if fmt[i] == "%":
+            directive = fmt[i : i + 2]
+            if directive == "%%":
+                literals.append((pos, "%"))
+                pos += 1
+            elif directive in FIXED_WIDTH:
+                width, field = FIXED_WIDTH[directive]
+                fields[field] = (pos, pos + width)
+                pos += width
+            else:
+                return None
+            i += 2
+        else:
+            literals.append((pos, fmt[i]))
+            pos += 1
+            i += 1
+    return {"width": pos, "fields": fields, "literals": literals}
+
+
+def char_matrix(values, width):
+    """
+    Strings as a (n, width) matrix of character codes without copying
+    each string
+
+    args:
+    ---
+    values -- numpy.array
+        Array of str, bytes or python strings
+    width -- int
+        Length every string must have
+
+    returns:
+    ---
+    numpy.array or None if some string has another length
+    """
+    values = asarray(values)
+    if values.dtype.kind == "O":
+        values = values.astype(str)
+    if values.dtype.kind not in "US":
+        return None
+    if len(values) == 0:
+        return zeros((0, width), dtype=uint8)
+    if (char.str_len(values) != width).any():
+        return None
+    if values.dtype.kind == "U":
+        return values.astype(f"U{width}").view(uint32).reshape(-1, width)
+    return values.astype(f"S{width}").view(uint8).reshape(-1, width)
+
+
+def parse_fixed_width(values, fmt):
+    """
+    Parse strings that have every field of fmt in the same position, eg.
+    "HH:MM:SS", by doing digit arithmetic on the character codes.
+
+    args:
+    ---
+    values -- numpy.array
+        Array of str, bytes or python strings
+    fmt -- str
+        strftime format with fixed width directives only
+
+    returns:
+    ---
+    fields -- dict
+        int64 array of each field in fmt, eg. {"hour": ..., "minute": ...}.
+        None if the values don't match the format, then slower parsing
+        should be used.
+    """
+    layout = fixed_width_layout(fmt)
+    if layout is None:
+        return None
+    chars = char_matrix(values, layout["width"])
+    if chars is None:
+        return None
+    for pos, literal in layout["literals"]:
+        if (chars[:, pos] != ord(literal)).any():
+            return None
+    fields = {}
+    for field, (start, stop) in layout["fields"].items():
+        digits = chars[:, start:stop].astype(int64) - ord("0")
+        if ((digits < 0) | (digits > 9)).any():
+            return None
+        weights = 10 ** arange(stop - start - 1, -1, -1, dtype=int64)
+        fields[field] = digits @ weights
+    return fields
+
+
+def parse_datetimes(values, fmt):
+    """
+    Vectorized pd.to_datetime(values, format=fmt) for fixed width layouts
+
+    args:
+    ---
+    values -- numpy.array
+        Array of str, bytes or python strings
+    fmt -- str
+        strftime format with fixed width directives only, eg.
+        "%Y-%m-%d%H:%M:%S"
+
+    returns:
+    ---
+    numpy.array
+        datetime64[ns] array, None if the values can't be parsed this way
+        or have fields out of range
+    """
+    fields = parse_fixed_width(values, fmt)
+    if fields is None or not {"year", "month", "day"} <= fields.keys():
+        return None
+    year = fields["year"]
+    if "%y" in fmt:
+        # same pivot as strptime
+        year = where(year < 69, year + 2000, year + 1900)
+    month = fields["month"]
+    day = fields["day"]
+    hour = fields.get("hour", 0)
+    minute = fields.get("minute", 0)
+    second = fields.get("second", 0)
+    if ((month < 1) | (month > 12)).any():
+        return None
+    months = (year - 1970) * 12 + month - 1
+    first = months.astype("datetime64[M]").astype("datetime64[D]")
+    next_first = (months + 1).astype("datetime64[M]").astype("datetime64[D]")
+    month_len = (next_first - first).view(int64)
+    if ((day < 1) | (day > month_len)).any():
+        return None
+    if (asarray(hour) > 23).any() or (asarray(minute) > 59).any():
+        return None
+    if (asarray(second) > 59).any():
+        return None
+    seconds = (first.view(int64) + day - 1) * 86400
+    seconds = seconds + hour * 3600 + minute * 60 + second
+    return (seconds * 1_000_000_000).view("datetime64[ns]")
+
+
+def parse_date_and_time(dates, times, date_fmt, time_fmt):
+    """
+    Datetimes from separate date and time columns, same as parsing the
+    concatenated strings with date_fmt + time_fmt
+
+    returns:
+    ---
+    numpy.array
+        datetime64[ns] array, None if parse_datetimes or parse_fixed_width
+        can't be used
+    """
+    days = parse_datetimes(dates, date_fmt)
+    fields = parse_fixed_width(times, time_fmt)
+    if days is None or fields is None:
+        return None
+    if not fields.keys() <= {"hour", "minute", "second"}:
+        return None
+    hour = fields.get("hour", 0)
+    minute = fields.get("minute", 0)
+    second = fields.get("second", 0)
+    if (asarray(hour) > 23).any() or (asarray(minute) > 59).any():
+        return None
+    if (asarray(second) > 59).any():
+        return None
+    seconds = hour * 3600 + minute * 60 + second
+    return days + (seconds * 1_000_000_000).astype("timedelta64[ns]")
+
+
 def time_to_numeric(time):
     """
     Helper function to calculate ordinal time from HH:MM:SS
@@ -47,6 +257,10 @@ def time_to_numeric(time):
     time -- numpy.array
         Array of float timestamps
     """
+    fields = parse_fixed_width(time, "%H:%M:%S")
+    if fields is not None:
+        return fields["hour"] * 3600 + fields["minute"] * 60 + fields["second"]
+    # times like 7:05:03 don't have fixed width
     # Split the HH:MM:SS strings; this creates a list of lists
     split_times = [time.split(":") for time in time]
     # Convert split times to hours, minutes, and seconds, and calculate the fractional day
@@ -57,6 +271,107 @@ def time_to_numeric(time):
     return numeric_times
 
 
+def datetime_to_epoch(times):
+    """
+    Seconds since epoch from datetime64 values without string formatting
+
+    args:
+    ---
+    times -- numpy.array
+        Array of datetime64 timestamps
+
+    returns:
+    ---
+    time -- numpy.array
+        Array of float timestamps
+    """
+    ns = asarray(times).astype("datetime64[ns]").view("int64")
+    return ns / 1e9
+
+
+def datetime_to_ordinal(times):
+    """
+    Vectorized datetime.datetime.toordinal for datetime64 values
+
+    args:
+    ---
+    times -- numpy.array
+        Array of datetime64 timestamps
+
+    returns:
+    ---
+    ordinal -- numpy.array
+        Array of int ordinal dates
+    """
+    days = asarray(times).astype("datetime64[D]").view("int64")
+    return days + ORDINAL_EPOCH
+
+
+def datetime_to_numeric(times):
+    """
+    Vectorized time_to_numeric for datetime64 values, seconds since midnight
+    without going through HH:MM:SS strings
+
+    args:
+    ---
+    times -- numpy.array
+        Array of datetime64 timestamps
+
+    returns:
+    ---
+    time -- numpy.array
+        Array of int seconds since midnight
+    """
+    times = asarray(times).astype("datetime64[ns]")
+    ns = (times - times.astype("datetime64[D]")).view("int64")
+    return ns // 1_000_000_000
+
+
+def datetime_to_strings(times):
+    """
+    YYYY-MM-DD and HH:MM:SS strings from datetime64 values. Formatted in
+    numpy instead of calling strftime for each value.
+
+    args:
+    ---
+    times -- numpy.array
+        Array of datetime64 timestamps
+
+    returns:
+    ---
+    dates, times -- numpy.array
+        Arrays of date and time strings
+    """
+    iso = datetime_as_string(asarray(times).astype("datetime64[s]"), unit="s")
+    # YYYY-MM-DDTHH:MM:SS, view each string as characters and slice out the
+    # date and time parts
+    chars = iso.astype("U19").view("U1").reshape(-1, 19)
+    dates = chars[:, :10].copy().view("U10").ravel()
+    times = chars[:, 11:].copy().view("U8").ravel()
+    return dates, times
+
+
+def epoch_from_parts(seconds, nanoseconds):
+    """
+    Seconds since epoch from separate seconds and nanoseconds columns
+
+    args:
+    ---
+    seconds -- numpy.array
+        Array of whole seconds since epoch
+    nanoseconds -- numpy.array
+        Array of nanoseconds
+
+    returns:
+    ---
+    time -- numpy.array
+        Array of float timestamps
+    """
+    seconds = asarray(seconds).astype("int64")
+    nanoseconds = asarray(nanoseconds).astype("int64")
+    return seconds + nanoseconds / 1e9
+
+
 def strftime_to_regex(file_timestamp_format):
     """
     Changes strftime timestamp to regex format
@@ -94,6 +409,111 @@ def strftime_to_regex(file_timestamp_format):
     return regex_pattern
 
 
+class timestampFormat:
+    """
+    strftime format compiled for finding and parsing timestamps in file
+    names. Use compile_timestamp_format to get one, they are cached per
+    format string.
+
+    Parameters
+    ----------
+    fmt : str
+        strftime format, eg. "%Y%m%d"
+    """
+
+    # datetime.datetime arguments and strptime defaults for fields missing
+    # from the format
+    fields = (
+        ("year", 1900),
+        ("month", 1),
+        ("day", 1),
+        ("hour", 0),
+        ("minute", 0),
+        ("second", 0),
+    )
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.regex = strftime_to_regex(fmt)
+        self.has_fields = self.regex != fmt
+        self.pattern = re.compile(self.regex)
+        # fixed offsets of the fields if the format allows slicing
+        self.layout = fixed_width_layout(fmt)
+        if self.layout is not None:
+            offsets = self.layout["fields"]
+            self.slices = [
+                offsets.get(field, (None, default)) for field, default in self.fields
+            ]
+            self.literals = self.layout["literals"]
+            self.width = self.layout["width"]
+            self.two_digit_year = "%y" in fmt
+
+    def search(self, string):
+        """The first part of string that looks like the format, or None"""
+        match = self.pattern.search(string)
+        if match is None:
+            return None
+        return match.group(0)
+
+    def parse(self, text):
+        """
+        Same as datetime.datetime.strptime(text, fmt), fixed width formats
+        are sliced instead of parsed.
+        """
+        if self.layout is None or len(text) != self.width:
+            return datetime.datetime.strptime(text, self.fmt)
+        for pos, literal in self.literals:
+            if text[pos] != literal:
+                return datetime.datetime.strptime(text, self.fmt)
+        values = []
+        for start, stop in self.slices:
+            if start is None:
+                values.append(stop)
+                continue
+            value = text[start:stop]
+            if not (value.isascii() and value.isdigit()):
+                return datetime.datetime.strptime(text, self.fmt)
+            values.append(int(value))
+        if self.two_digit_year:
+            values[0] += 2000 if values[0] < 69 else 1900
+        return datetime.datetime(*values)
+
+    def parse_all(self, texts):
+        """
+        parse for a list of texts, fixed width formats are parsed as one
+        array with parse_datetimes
+        """
+        if self.layout is not None and texts:
+            parsed = parse_datetimes(array(texts), self.fmt)
+            if parsed is not None:
+                return parsed.astype("datetime64[us]").tolist()
+        return [self.parse(text) for text in texts]
+
+    def extract(self, string):
+        """Datetime of the first timestamp in string, None if there isn't one"""
+        text = self.search(string)
+        if text is None:
+            return None
+        return self.parse(text)
+
+
+@lru_cache(maxsize=None)
+def compile_timestamp_format(fmt):
+    """
+    timestampFormat for fmt, compiled only once for each format string
+
+    args:
+    ---
+    fmt -- str
+        strftime format
+
+    returns:
+    ---
+    timestampFormat
+    """
+    return timestampFormat(fmt)
+
+
 def check_timestamp(start_timestamp, end_timestamp):
     """
     Compare the start and end timestamps, if start timestamp is
@@ -132,14 +552,15 @@ def extract_date(file_timestamp_format, datestring):
     # except AttributeError:
     #    print('Files are found in folder but no matching file found, is the format of the timestamp correct?')
     #    return None
-    if file_timestamp_format == strftime_to_regex(file_timestamp_format):
+    fmt = compile_timestamp_format(file_timestamp_format)
+    if not fmt.has_fields:
         logger.info("No strftime formatting in filename, returning current date")
         return datetime.datetime.today()
-    date = re.search(strftime_to_regex(file_timestamp_format), datestring).group(0)
+    date = fmt.pattern.search(datestring).group(0)
     # class chamber_cycle calls this method and using an instance
     # variable here might cause issues if the timestamp formats
     # should be different
-    return datetime.datetime.strptime(date, file_timestamp_format)
+    return fmt.parse(date)
 
 
 def get_time_diff(start, stop):
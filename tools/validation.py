@@ -1,34 +1,87 @@
 #!/usr/bin/env python3
 
+import numpy as np
 import pandas as pd
 import logging
-from tools.filter import date_filter
+from tools.filter import segmentOffsets
+from tools.merging import measurement_values
 
 logger = logging.getLogger("defaultLogger")
 
+# instrument of each cycle when schedules of several instruments are merged,
+# cycles of different instruments don't overlap each other
+INSTRUMENT_COL = "li_id"
+
 
 def use_defaults(df, use_defaults):
     cols = df.columns
     return "air_temperature" not in cols or "air_pressure" not in cols
 
 
-def set_next_true(df, column):
-    true_indices = df[df[column]].index
-    for idx in true_indices:
-        next_idx = df.index.get_loc(idx) + 1
-        if next_idx < len(df):
-            df.iloc[next_idx, df.columns.get_loc(column)] = True
-    return df
-
-
-def overlap_test(df):
+def overlap_counts(starts, ends, groups=None):
+    """
+    Number of other cycles each cycle overlaps with.
+
+    Cycle j overlaps cycle i if it starts before i ends and ends after i
+    starts, so the count is the number of cycles starting before end_i minus
+    the ones that have ended by start_i, minus i itself. Both are found with
+    searchsorted on the sorted starts and ends, which also catches long
+    cycles that span several others.
+
+    Parameters
+    ----------
+    starts, ends : array like
+        Start and end times of the cycles, ends must be after starts
+
+    groups : array like
+        Only cycles in the same group are compared, eg. the instrument of
+        each cycle when schedules of several instruments are merged
+
+    Returns
+    -------
+    counts : np.array
+        int64 count for each cycle in the given order
+    """
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    if groups is None:
+        s_sorted = np.sort(starts)
+        e_sorted = np.sort(ends)
+        started = np.searchsorted(s_sorted, ends, side="left")
+        ended = np.searchsorted(e_sorted, starts, side="right")
+        return (started - ended - 1).astype(np.int64)
+    counts = np.zeros(len(starts), dtype=np.int64)
+    codes, _ = pd.factorize(np.asarray(groups))
+    for code in np.unique(codes):
+        rows = np.flatnonzero(codes == code)
+        counts[rows] = overlap_counts(starts[rows], ends[rows])
+    return counts
+
+
+def overlap_test(df, group_col=None):
     """
     Checks overlapping measurement in the measurement times.
+
+    args:
+    ---
+    df -- pandas.dataframe
+        Measurement times with start_time and end_time columns
+    group_col -- str
+        Column to group the cycles by, cycles in different groups don't
+        overlap each other. Not used if df doesn't have it
+
+    returns:
+    ---
+    df sorted by start_time with an overlap_count column, the number of
+    other cycles each cycle overlaps, and a boolean overlap column
     """
     df = df.sort_values(by="start_time")
-    df["next_start_time"] = df["start_time"].shift(-1)
-    df["overlap"] = df["end_time"] > df["next_start_time"]
-    df = set_next_true(df, "overlap")
+    groups = None
+    if group_col is not None and group_col in df.columns:
+        groups = df[group_col]
+    counts = overlap_counts(df["start_time"], df["end_time"], groups)
+    df["overlap_count"] = counts
+    df["overlap"] = counts > 0
     return df
 
 
@@ -52,21 +105,46 @@ def check_too_many(df, measurement_time):
     return len(df) > measurement_time * 1.1
 
 
-def check_valid(dataframe, filter_tuple, device, measurement_time):
+def has_aux_stat(aux_stats, i, col):
+    """Check if an aggregated aux column has a value for measurement i."""
+    if aux_stats is None or col not in aux_stats.columns:
+        return False
+    return not pd.isna(aux_stats[col].iat[i])
+
+
+def check_valid(
+    dataframe,
+    filter_tuple,
+    device,
+    measurement_time,
+    aux_stats=None,
+    meas_table=None,
+    segments=None,
+):
     # NOTE: Should this be moved inside one of the existing loops?
     # This loops through everything again, would be better to have it in the
     # same loop where we calculate flux?
     logger.debug("Checking validity")
+    # offsets resolved for another frame can be used if it has the same rows
+    if segments is None or not segments.fits(dataframe):
+        segments = segmentOffsets(dataframe, filter_tuple)
     dfa = []
     missing_data = False
-    for date in filter_tuple:
-        df = date_filter(dataframe, date).copy()
+    for i in range(len(filter_tuple)):
+        df = segments.slice(dataframe, i).copy()
 
         has_errors = check_diag_col(df, device)
-        no_air_temp = check_air_temp_col(df)
-        no_air_pressure = check_air_press_col(df)
+        no_air_temp = check_air_temp_col(df) and not has_aux_stat(
+            aux_stats, i, "air_temperature"
+        )
+        no_air_pressure = check_air_press_col(df) and not has_aux_stat(
+            aux_stats, i, "air_pressure"
+        )
         is_empty = df.empty
-        has_overlap = df.overlap.any()
+        if meas_table is not None:
+            has_overlap = measurement_values(df, meas_table, "overlap").any()
+        else:
+            has_overlap = df.overlap.any()
         too_many = check_too_many(df, measurement_time)
         too_few = check_too_few(df, measurement_time)
 
@@ -97,7 +175,7 @@ def check_valid(dataframe, filter_tuple, device, measurement_time):
                 checks.append("too few measurements,")
 
             checks_str = "".join(checks)
-            df.loc[:, "checks"] += checks_str
+            df["checks"] = df["checks"].astype(str) + checks_str
             df.loc[:, "is_valid"] = False
 
         dfa.append(df)